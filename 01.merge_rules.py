@@ -1,9 +1,23 @@
+import asyncio
+import collections
 import concurrent.futures
+import cProfile
+import contextlib
+import functools
+import hashlib
+import importlib.util
+import inspect
+import io
 import ipaddress
+import json
 import os
-import shutil
+import pickle
+import queue
+import random
+import re
 import subprocess
 import sys
+import tarfile
 import threading
 import time
 from pathlib import Path
@@ -12,18 +26,59 @@ from urllib.parse import urlparse
 import requests
 import yaml
 
+from build_trace import SUPPORTED_TRACE_FORMATS, BuildTrace
+from payload_io import (
+    get_temp_path,
+    hash_file,
+    hash_text,
+    parse_payload_text,
+    render_payload,
+    stage_text_file,
+    write_publish_report,
+)
+from proxy_weighting import (
+    PROXY_FILENAMES,
+    RuleWeightingError,
+    build_proxy_updates,
+    get_weighting_mode,
+    get_weighting_workers,
+    load_payload_file,
+)
+from rule_index import DomainSuffixTrie, collapse_intervals, find_covered_intervals
+from rule_record import RuleRecord, format_network, format_rule, parse_rule, split_behavior_payloads
+
 try:
     from yaml import CSafeDumper as SafeDumper
     from yaml import CSafeLoader as SafeLoader
 except ImportError:
     from yaml import SafeDumper, SafeLoader
 
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
 
 SOURCE_DIR = Path("./source")
 RULES_DIR = Path("./rules")
 RULES_SET_DIR = RULES_DIR / "rules_set"
-TMP_OUTPUT_DIR = Path("./.tmp_rules")
 DLC_REPO_DIR = Path("./.cache/domain-list-community")
+DLC_ARCHIVE_DIR = Path("./.cache/domain-list-community-archive")
+HTTP_CACHE_DIR = Path("./.cache/http")
+BUILD_MANIFEST_PATH = Path("./.cache/build_manifest.json")
+PUBLISH_REPORT_PATH = Path("./.cache/publish_report.json")
+BUILD_MANIFEST_VERSION = 1
+DLC_INDEX_VERSION = 2
+PIPELINE_FILES = (
+    Path(__file__),
+    Path(__file__).with_name("build_trace.py"),
+    Path(__file__).with_name("payload_io.py"),
+    Path(__file__).with_name("proxy_weighting.py"),
+    Path(__file__).with_name("rule_index.py"),
+    Path(__file__).with_name("rule_record.py"),
+)
+ENV_TRUE_VALUES = {"1", "true", "yes", "on"}
+ENV_FALSE_VALUES = {"0", "false", "no", "off"}
 REPO_RAW_BASE = "https://raw.githubusercontent.com/darkli/research/main/rules/rules_set"
 DLC_GIT_REPO = "git@github.com:v2fly/domain-list-community.git"
 REQUEST_HEADERS = {"User-Agent": "darkli-research-rule-updater"}
@@ -31,8 +86,22 @@ REQUEST_TIMEOUT = (10, 300)
 MAX_DOWNLOAD_ATTEMPTS = 6
 FALLBACK_AFTER_ATTEMPTS = 2
 DEFAULT_DOWNLOAD_WORKERS = 8
+DEFAULT_HOST_CONNECTIONS = 6
+ASYNC_BACKOFF_BASE = 1.0
+ASYNC_BACKOFF_CAP = 10.0
+SUPPORTED_DOWNLOAD_ENGINES = {"thread", "async"}
+DEFAULT_PROCESS_WORKERS = 1
+DEFAULT_MIHOMO_BIN = "mihomo"
+BEHAVIOR_PROVIDERS = ("domain", "ipcidr")
 DLC_DATA_PATH_MARKER = "/data/"
 SUPPORTED_SOURCE_FORMATS = {"auto", "clash", "dlc"}
+GEOSITE_DOMAIN_TYPES = {0: "keyword", 1: "regexp", 2: "domain", 3: "full"}
+SUPPORTED_NO_RESOLVE_MODES = {"source", "derive", "verify"}
+NO_RESOLVE_SUBPATH = "no_resolve"
+NO_RESOLVE_OPTION = "no-resolve"
+NO_RESOLVE_RULE_TYPES = frozenset({"IP-CIDR", "IP-CIDR6", "IP-ASN", "IP-SUFFIX", "GEOIP"})
+NO_RESOLVE_URL_PATTERN = re.compile(r"_No_Resolve(\.[A-Za-z]+)$", re.IGNORECASE)
+NO_RESOLVE_DIFF_EXAMPLES = 5
 RULE_TYPE_ORDER = {
     "DOMAIN": 10,
     "DOMAIN-SUFFIX": 20,
@@ -50,6 +119,12 @@ MANUAL_RULE_PATHS = {
     "uk_vowifi.yaml",
 }
 THREAD_LOCAL = threading.local()
+HTTP_CACHE_LOCK = threading.Lock()
+HTTP_CACHE_STATS = {"hit": 0, "revalidated": 0, "miss": 0}
+BUILD_TRACE = BuildTrace()
+WORKER_DLC_CACHE = {}
+WORKER_PAYLOAD_CACHE = {}
+WORKER_DLC_STATE = {"repo_ready": False, "commit": None, "deps": {}}
 
 
 class RuleUpdateError(Exception):
@@ -60,8 +135,17 @@ def yaml_load(stream):
     return yaml.load(stream, Loader=SafeLoader)
 
 
-def yaml_dump(data, stream):
-    yaml.dump(data, stream, Dumper=SafeDumper, allow_unicode=True, sort_keys=False, default_flow_style=False)
+def yaml_dump(data, stream=None):
+    return yaml.dump(
+        data, stream, Dumper=SafeDumper, allow_unicode=True, sort_keys=False, default_flow_style=False
+    )
+
+
+def get_env_flag(name, default=False):
+    raw_value = os.environ.get(name, "").strip().lower()
+    if default:
+        return raw_value not in ENV_FALSE_VALUES
+    return raw_value in ENV_TRUE_VALUES
 
 
 def get_download_workers():
@@ -73,6 +157,108 @@ def get_download_workers():
     return max(1, workers)
 
 
+def get_download_engine():
+    engine = os.environ.get("RULE_DOWNLOAD_ENGINE", "thread").strip().lower()
+    if engine not in SUPPORTED_DOWNLOAD_ENGINES:
+        raise RuleUpdateError(
+            f"RULE_DOWNLOAD_ENGINE must be one of {sorted(SUPPORTED_DOWNLOAD_ENGINES)}: {engine!r}"
+        )
+    return engine
+
+
+def get_host_connections():
+    raw_value = os.environ.get("RULE_HOST_CONNECTIONS", str(DEFAULT_HOST_CONNECTIONS))
+    try:
+        connections = int(raw_value)
+    except ValueError as exc:
+        raise RuleUpdateError(f"RULE_HOST_CONNECTIONS must be an integer: {raw_value!r}") from exc
+    return max(1, connections)
+
+
+def get_process_workers():
+    raw_value = os.environ.get("RULE_PROCESS_WORKERS", str(DEFAULT_PROCESS_WORKERS))
+    try:
+        workers = int(raw_value)
+    except ValueError as exc:
+        raise RuleUpdateError(f"RULE_PROCESS_WORKERS must be an integer: {raw_value!r}") from exc
+    return max(1, workers)
+
+
+def get_http_cache_enabled():
+    return get_env_flag("RULE_HTTP_CACHE", default=True)
+
+
+def get_http_cache_max_age():
+    raw_value = os.environ.get("RULE_HTTP_CACHE_MAX_AGE", "0")
+    try:
+        max_age = int(raw_value)
+    except ValueError as exc:
+        raise RuleUpdateError(f"RULE_HTTP_CACHE_MAX_AGE must be an integer: {raw_value!r}") from exc
+    return max(0, max_age)
+
+
+def get_incremental_enabled():
+    return get_env_flag("RULE_INCREMENTAL", default=True)
+
+
+def get_weighting_enabled():
+    return get_env_flag("RULE_WEIGHTING")
+
+
+def get_mrs_enabled():
+    return get_env_flag("RULE_MRS")
+
+
+def get_split_behavior_enabled():
+    return get_env_flag("RULE_SPLIT_BEHAVIOR")
+
+
+def get_mihomo_bin():
+    return os.environ.get("RULE_MIHOMO_BIN", DEFAULT_MIHOMO_BIN).strip() or DEFAULT_MIHOMO_BIN
+
+
+def get_trace_path():
+    raw_value = os.environ.get("RULE_TRACE", "").strip()
+    return Path(raw_value) if raw_value else None
+
+
+def get_trace_format():
+    trace_format = os.environ.get("RULE_TRACE_FORMAT", "json").strip().lower()
+    if trace_format not in SUPPORTED_TRACE_FORMATS:
+        raise RuleUpdateError(
+            f"RULE_TRACE_FORMAT must be one of {sorted(SUPPORTED_TRACE_FORMATS)}: {trace_format!r}"
+        )
+    return trace_format
+
+
+def get_profile_path():
+    raw_value = os.environ.get("RULE_PROFILE", "").strip()
+    return Path(raw_value) if raw_value else None
+
+
+def get_no_resolve_mode():
+    mode = os.environ.get("RULE_NO_RESOLVE_MODE", "source").strip().lower()
+    if mode not in SUPPORTED_NO_RESOLVE_MODES:
+        raise RuleUpdateError(
+            f"RULE_NO_RESOLVE_MODE must be one of {sorted(SUPPORTED_NO_RESOLVE_MODES)}: {mode!r}"
+        )
+    return mode
+
+
+def get_dlc_archive_path():
+    raw_value = os.environ.get("RULE_DLC_ARCHIVE", "").strip()
+    return Path(raw_value).expanduser() if raw_value else None
+
+
+def get_dlc_repo_dir():
+    # Archive builds keep their own index so they never read a stale git checkout.
+    return DLC_ARCHIVE_DIR if get_dlc_archive_path() is not None else DLC_REPO_DIR
+
+
+def get_ip_aggregate_enabled():
+    return get_env_flag("RULE_IP_AGGREGATE")
+
+
 def get_thread_session():
     session = getattr(THREAD_LOCAL, "session", None)
     if session is None:
@@ -91,12 +277,6 @@ def load_yaml_file(file_path):
     return data
 
 
-def write_yaml_file(file_path, data):
-    file_path.parent.mkdir(parents=True, exist_ok=True)
-    with file_path.open("w", encoding="utf-8") as f:
-        yaml_dump(data, f)
-
-
 def validate_payload(data, url):
     if not isinstance(data, dict):
         raise RuleUpdateError(f"Downloaded YAML is not a mapping: {url}")
@@ -110,67 +290,254 @@ def validate_payload(data, url):
     return payload
 
 
-def get_url_text(url, session=None):
-    session = session or get_thread_session()
-    last_error = None
+def reset_http_cache_stats():
+    with HTTP_CACHE_LOCK:
+        for key in HTTP_CACHE_STATS:
+            HTTP_CACHE_STATS[key] = 0
+
+
+def record_http_cache_result(result, url=None):
+    with HTTP_CACHE_LOCK:
+        HTTP_CACHE_STATS[result] += 1
+    if url is not None:
+        BUILD_TRACE.record_url(url, cache=result)
+
+
+def reset_build_trace():
+    global BUILD_TRACE
+    BUILD_TRACE = BuildTrace()
+    return BUILD_TRACE
+
+
+def record_download(url, started_at, attempts, text=None, fallback_url=None, error=None):
+    duration = time.time() - started_at
+    BUILD_TRACE.record_url(
+        url,
+        seconds=duration,
+        bytes=len(text.encode("utf-8")) if text is not None else None,
+        attempts=attempts,
+        retries=attempts - 1,
+        fallback=fallback_url,
+        error=str(error) if error is not None else None,
+    )
+    BUILD_TRACE.add_span(url, "download", started_at, duration, attempts=attempts, fallback=fallback_url)
+
+
+def get_http_cache_paths(url, cache_dir=HTTP_CACHE_DIR):
+    key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    return cache_dir / f"{key}.json", cache_dir / f"{key}.body"
+
+
+def write_http_cache_file(file_path, data):
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = file_path.with_name(f".{file_path.name}.{threading.get_ident()}.tmp")
+    temp_path.write_bytes(data)
+    temp_path.replace(file_path)
+
+
+def load_http_cache_entry(url, cache_dir=HTTP_CACHE_DIR):
+    meta_path, body_path = get_http_cache_paths(url, cache_dir)
+    try:
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        body = body_path.read_text(encoding="utf-8")
+    except (OSError, ValueError):
+        return None
+    if not isinstance(meta, dict) or meta.get("url") != url:
+        return None
+    if hashlib.sha256(body.encode("utf-8")).hexdigest() != meta.get("sha256"):
+        return None
+    meta["body"] = body
+    return meta
+
+
+def store_http_cache_entry(url, body, etag, last_modified, write_body=True, cache_dir=HTTP_CACHE_DIR):
+    meta_path, body_path = get_http_cache_paths(url, cache_dir)
+    meta = {
+        "url": url,
+        "etag": etag,
+        "last_modified": last_modified,
+        "fetched_at": time.time(),
+        "sha256": hashlib.sha256(body.encode("utf-8")).hexdigest(),
+    }
+    try:
+        if write_body:
+            write_http_cache_file(body_path, body.encode("utf-8"))
+        write_http_cache_file(meta_path, json.dumps(meta, ensure_ascii=False).encode("utf-8"))
+    except OSError as exc:
+        print(f"Failed to update HTTP cache for {url}: {exc}", flush=True)
+
+
+def build_conditional_headers(cache_entry):
+    headers = {}
+    if cache_entry.get("etag"):
+        headers["If-None-Match"] = cache_entry["etag"]
+    if cache_entry.get("last_modified"):
+        headers["If-Modified-Since"] = cache_entry["last_modified"]
+    return headers
+
+
+def begin_cached_fetch(url):
+    if not get_http_cache_enabled():
+        return None, {}, None
+
+    cache_entry = load_http_cache_entry(url)
+    if cache_entry is None:
+        return None, {}, None
+    max_age = get_http_cache_max_age()
+    if max_age and time.time() - cache_entry.get("fetched_at", 0) < max_age:
+        record_http_cache_result("hit", url)
+        return cache_entry, {}, cache_entry["body"]
+    return cache_entry, build_conditional_headers(cache_entry), None
+
+
+def complete_cached_fetch(url, cache_entry, response):
+    if response.status_code == 304:
+        if cache_entry is None:
+            raise RuleUpdateError(f"Unexpected 304 Not Modified without cached body: {url}")
+        store_http_cache_entry(
+            url,
+            cache_entry["body"],
+            response.headers.get("ETag") or cache_entry.get("etag"),
+            response.headers.get("Last-Modified") or cache_entry.get("last_modified"),
+            write_body=False,
+        )
+        record_http_cache_result("revalidated", url)
+        return cache_entry["body"]
+
+    response.raise_for_status()
+    text = response.text
+    if get_http_cache_enabled():
+        store_http_cache_entry(url, text, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+        record_http_cache_result("miss", url)
+    return text
+
+
+def fetch_url_text(url, session):
+    cache_entry, headers, cached_body = begin_cached_fetch(url)
+    if cached_body is not None:
+        return cached_body
+    response = session.get(url, timeout=REQUEST_TIMEOUT, headers=headers)
+    return complete_cached_fetch(url, cache_entry, response)
+
+
+def iter_download_attempts(url):
+    """Drive the retries and GitHub raw fallback of one download without doing any I/O.
+
+    Both download engines run this generator. It yields ``(url to fetch, failed
+    attempt to back off after)`` with ``0`` meaning no delay, and is sent back
+    ``(text, error)``. It returns the text, or raises ``RuleUpdateError`` once
+    every attempt has failed.
+    """
+    started_at = time.time()
+    fallback_url = get_github_raw_fallback_url(url)
     fallback_error = None
-    fallback_attempted = False
     for attempt in range(1, MAX_DOWNLOAD_ATTEMPTS + 1):
-        try:
-            response = session.get(url, timeout=REQUEST_TIMEOUT)
-            response.raise_for_status()
+        text, error = yield url, attempt - 1
+        if error is None:
             if attempt > 1:
                 print(f"Download recovered for {url} on attempt {attempt}/{MAX_DOWNLOAD_ATTEMPTS}", flush=True)
-            break
-        except requests.RequestException as exc:
-            last_error = exc
-            if attempt >= FALLBACK_AFTER_ATTEMPTS and not fallback_attempted:
-                fallback_attempted = True
-                fallback_text, fallback_error = get_github_raw_fallback_text(url, exc, session)
-                if fallback_text is not None:
-                    return fallback_text
-            if attempt == MAX_DOWNLOAD_ATTEMPTS:
-                if fallback_error is not None:
-                    print(f"Last fallback error for {url}: {fallback_error}", flush=True)
-                raise RuleUpdateError(
-                    f"Failed to download {url} after {MAX_DOWNLOAD_ATTEMPTS} attempts: {exc}"
-                ) from exc
+            record_download(url, started_at, attempt, text)
+            return text
+        if attempt == FALLBACK_AFTER_ATTEMPTS and fallback_url is not None:
+            fallback_text, fallback_error = yield fallback_url, 0
+            if fallback_error is None:
+                print(f"Download recovered for {url} via fallback {fallback_url}", flush=True)
+                record_download(url, started_at, attempt, fallback_text, fallback_url)
+                return fallback_text
             print(
-                f"Download failed for {url} on attempt {attempt}/{MAX_DOWNLOAD_ATTEMPTS}; "
-                f"retrying attempt {attempt + 1}/{MAX_DOWNLOAD_ATTEMPTS}: {exc}",
+                f"Fallback download failed for {url} via {fallback_url}: {fallback_error}; "
+                f"original error: {error}",
                 flush=True,
             )
-            time.sleep(min(attempt * 2, 10))
-    else:
-        raise RuleUpdateError(f"Failed to download {url}: {last_error}")
+        if attempt == MAX_DOWNLOAD_ATTEMPTS:
+            if fallback_error is not None:
+                print(f"Last fallback error for {url}: {fallback_error}", flush=True)
+            record_download(url, started_at, attempt, error=error)
+            raise RuleUpdateError(
+                f"Failed to download {url} after {MAX_DOWNLOAD_ATTEMPTS} attempts: {error}"
+            ) from error
+        print(
+            f"Download failed for {url} on attempt {attempt}/{MAX_DOWNLOAD_ATTEMPTS}; "
+            f"retrying attempt {attempt + 1}/{MAX_DOWNLOAD_ATTEMPTS}: {error}",
+            flush=True,
+        )
 
-    return response.text
+
+def get_url_text(url, session=None):
+    session = session or get_thread_session()
+    attempts = iter_download_attempts(url)
+    fetch_url, retry_after = next(attempts)
+    while True:
+        if retry_after:
+            time.sleep(min(retry_after * 2, 10))
+        try:
+            result = fetch_url_text(fetch_url, session), None
+        except requests.RequestException as exc:
+            result = None, exc
+        try:
+            fetch_url, retry_after = attempts.send(result)
+        except StopIteration as finished:
+            return finished.value
 
 
-def get_github_raw_fallback_text(url, original_error, session=None):
+def get_github_raw_fallback_url(url):
     parsed = urlparse(url)
     if parsed.netloc != "raw.githubusercontent.com":
-        return None, None
+        return None
 
     parts = parsed.path.lstrip("/").split("/", 3)
     if len(parts) != 4:
-        return None, None
+        return None
 
     owner, repo, ref, file_path = parts
-    fallback_url = f"https://cdn.jsdelivr.net/gh/{owner}/{repo}@{ref}/{file_path}"
-    session = session or get_thread_session()
-    try:
-        response = session.get(fallback_url, timeout=REQUEST_TIMEOUT)
-        response.raise_for_status()
-    except requests.RequestException as exc:
-        print(
-            f"Fallback download failed for {url} via {fallback_url}: {exc}; original error: {original_error}",
-            flush=True,
-        )
-        return None, exc
-
-    print(f"Download recovered for {url} via fallback {fallback_url}", flush=True)
-    return response.text, None
+    return f"https://cdn.jsdelivr.net/gh/{owner}/{repo}@{ref}/{file_path}"
+
+
+def get_retry_delay(attempt):
+    return random.uniform(0, min(ASYNC_BACKOFF_CAP, ASYNC_BACKOFF_BASE * 2 ** (attempt - 1)))
+
+
+def create_async_client(host_count, host_connections):
+    http2 = importlib.util.find_spec("h2") is not None
+    client = httpx.AsyncClient(
+        headers=REQUEST_HEADERS,
+        timeout=httpx.Timeout(REQUEST_TIMEOUT[1], connect=REQUEST_TIMEOUT[0]),
+        limits=httpx.Limits(
+            max_connections=host_count * host_connections,
+            max_keepalive_connections=host_count * host_connections,
+        ),
+        http2=http2,
+        follow_redirects=True,
+    )
+    return client, http2
+
+
+async def fetch_url_text_async(url, client, host_limits, host_connections):
+    # The HTTP cache reads and writes files, so it runs on a worker thread instead of the event loop.
+    cache_entry, headers, cached_body = await asyncio.to_thread(begin_cached_fetch, url)
+    if cached_body is not None:
+        return cached_body
+    host = urlparse(url).netloc
+    semaphore = host_limits.setdefault(host, asyncio.Semaphore(host_connections))
+    async with semaphore:
+        response = await client.get(url, headers=headers)
+    return await asyncio.to_thread(complete_cached_fetch, url, cache_entry, response)
+
+
+async def get_url_text_async(url, client, host_limits, host_connections):
+    attempts = iter_download_attempts(url)
+    fetch_url, retry_after = next(attempts)
+    while True:
+        if retry_after:
+            await asyncio.sleep(get_retry_delay(retry_after))
+        try:
+            result = await fetch_url_text_async(fetch_url, client, host_limits, host_connections), None
+        except httpx.HTTPError as exc:
+            result = None, exc
+        try:
+            fetch_url, retry_after = attempts.send(result)
+        except StopIteration as finished:
+            return finished.value
 
 
 def is_dlc_data_url(url):
@@ -200,22 +567,418 @@ def run_command(command, cwd=None):
         raise RuleUpdateError(f"Command failed: {' '.join(command)}\n{stderr.strip()}") from exc
 
 
+def get_dlc_repo_commit(repo_dir):
+    return run_command(["git", "rev-parse", "HEAD"], cwd=repo_dir).stdout.strip()
+
+
 def ensure_dlc_repo(repo_dir):
     if repo_dir.exists():
         if not (repo_dir / ".git").exists():
             raise RuleUpdateError(f"DLC cache path exists but is not a git repository: {repo_dir}")
+        try:
+            previous_commit = get_dlc_repo_commit(repo_dir)
+        except RuleUpdateError:
+            previous_commit = None
         run_command(["git", "fetch", "--depth=1", "origin", "master"], cwd=repo_dir)
         run_command(["git", "checkout", "-q", "FETCH_HEAD"], cwd=repo_dir)
-    else:
-        repo_dir.parent.mkdir(parents=True, exist_ok=True)
-        run_command(["git", "clone", "--depth=1", DLC_GIT_REPO, str(repo_dir)])
+        return previous_commit
+
+    repo_dir.parent.mkdir(parents=True, exist_ok=True)
+    run_command(["git", "clone", "--depth=1", DLC_GIT_REPO, str(repo_dir)])
+    return None
+
+
+def read_protobuf_varint(data, offset):
+    result = 0
+    shift = 0
+    while offset < len(data):
+        byte = data[offset]
+        offset += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, offset
+        shift += 7
+    raise ValueError("truncated protobuf varint")
+
+
+def iter_protobuf_fields(data):
+    """Yield ``(field number, value)``; length-delimited values are memoryview slices of ``data``."""
+    offset = 0
+    while offset < len(data):
+        key, offset = read_protobuf_varint(data, offset)
+        field_number, wire_type = key >> 3, key & 0x07
+        if wire_type == 0:
+            value, offset = read_protobuf_varint(data, offset)
+        elif wire_type == 2:
+            length, offset = read_protobuf_varint(data, offset)
+            value = data[offset : offset + length]
+            offset += length
+        elif wire_type in {1, 5}:
+            size = 8 if wire_type == 1 else 4
+            value = data[offset : offset + size]
+            offset += size
+        else:
+            raise ValueError(f"unsupported protobuf wire type {wire_type}")
+        if offset > len(data):
+            raise ValueError("truncated protobuf field")
+        yield field_number, value
+
+
+def read_geosite_entries(data):
+    """Split a ``GeoSiteList`` into raw ``GeoSite`` messages keyed by lower-case country code."""
+    entries = {}
+    for field_number, site in iter_protobuf_fields(memoryview(data)):
+        if field_number != 1 or not isinstance(site, memoryview):
+            raise ValueError("not a GeoSiteList message")
+        for site_field, value in iter_protobuf_fields(site):
+            if site_field == 1 and isinstance(value, memoryview):
+                entries[bytes(value).decode("utf-8").lower()] = site
+                break
+        else:
+            raise ValueError("GeoSite entry has no country code")
+    return entries
+
+
+def parse_geosite_rules(site):
+    rules = []
+    for field_number, domain in iter_protobuf_fields(site):
+        if field_number != 2:
+            continue
+        domain_type = 0
+        value = ""
+        attributes = []
+        for domain_field, domain_value in iter_protobuf_fields(domain):
+            if domain_field == 1:
+                domain_type = domain_value
+            elif domain_field == 2:
+                value = bytes(domain_value).decode("utf-8")
+            elif domain_field == 3:
+                for attribute_field, attribute_value in iter_protobuf_fields(domain_value):
+                    if attribute_field == 1:
+                        attributes.append(bytes(attribute_value).decode("utf-8"))
+        if domain_type not in GEOSITE_DOMAIN_TYPES:
+            raise ValueError(f"unsupported geosite domain type {domain_type}")
+        rules.append((GEOSITE_DOMAIN_TYPES[domain_type], value, tuple(attributes)))
+    return rules
+
+
+def read_dlc_tarball_entries(data):
+    entries = {}
+    with tarfile.open(fileobj=io.BytesIO(data), mode="r:*") as tar:
+        for member in tar:
+            parts = member.name.split("/")
+            if member.isfile() and 2 <= len(parts) <= 3 and parts[-2] == "data":
+                entries[parts[-1]] = tar.extractfile(member).read()
+    return entries
+
+
+def load_dlc_archive(archive_path):
+    """Read a domain-list-community tarball or a compiled geosite ``dlc.dat`` with one bulk read.
+
+    Entries stay raw bytes keyed by DLC name and are only parsed when the index needs them.
+    """
+    try:
+        data = archive_path.read_bytes()
+    except OSError as exc:
+        raise RuleUpdateError(f"Failed to read DLC archive {archive_path}: {exc}") from exc
+    try:
+        archive_format, entries = "tarball", read_dlc_tarball_entries(data)
+    except tarfile.TarError:
+        try:
+            archive_format, entries = "geosite", read_geosite_entries(data)
+        except ValueError as exc:
+            raise RuleUpdateError(
+                f"DLC archive is neither a repository tarball nor geosite data: {archive_path}: {exc}"
+            ) from exc
+    if not entries:
+        raise RuleUpdateError(f"DLC archive has no data entries: {archive_path}")
+    return {
+        "format": archive_format,
+        "sha256": hashlib.sha256(data).hexdigest(),
+        "entries": entries,
+        "hashes": {name: hashlib.sha256(raw).hexdigest() for name, raw in entries.items()},
+    }
+
+
+def parse_dlc_archive_entries(archive, dlc_names, dlc_errors):
+    """Parse archive entries; an entry that fails keeps its error in ``dlc_errors`` instead."""
+    parsed_files = {}
+    for dlc_name in dlc_names:
+        raw = archive["entries"].get(dlc_name)
+        if raw is None:
+            continue
+        url = f"domain-list-community/data/{dlc_name}"
+        try:
+            if archive["format"] == "geosite":
+                parsed_files[dlc_name] = ((), tuple(parse_geosite_rules(raw)))
+            else:
+                includes, rules = parse_dlc_text(bytes(raw).decode("utf-8"), url)
+                parsed_files[dlc_name] = (tuple(includes), tuple(rules))
+        except RuleUpdateError as exc:
+            dlc_errors[dlc_name] = str(exc)
+        except ValueError as exc:
+            dlc_errors[dlc_name] = f"Invalid {archive['format']} entry {url} in DLC archive: {exc}"
+    return parsed_files
+
+
+def sync_dlc_repo(repo_dir, dlc_state):
+    """Fetch or clone the DLC repo (or load ``RULE_DLC_ARCHIVE``) and record its commit.
+
+    Returns the log line, if any. For an archive the "commit" is the archive's sha256.
+    """
+    started_at = time.time()
+    archive_path = get_dlc_archive_path()
+    if archive_path is not None:
+        archive = load_dlc_archive(archive_path)
+        dlc_state["archive"] = archive
+        dlc_state["commit"] = archive["sha256"]
+        dlc_state["repo_ready"] = True
+        BUILD_TRACE.add_span(
+            "dlc_sync", "stage", started_at, time.time() - started_at, archive=str(archive_path)
+        )
+        return (
+            f"Loaded DLC archive {archive_path}: format={archive['format']}, "
+            f"entries={len(archive['entries'])}, sha256={archive['sha256'][:12]}"
+        )
+
+    previous_commit = ensure_dlc_repo(repo_dir)
+    dlc_state["previous_commit"] = previous_commit
+    dlc_state["commit"] = get_dlc_repo_commit(repo_dir)
+    dlc_state["repo_ready"] = True
+    BUILD_TRACE.add_span("dlc_sync", "stage", started_at, time.time() - started_at)
+    if previous_commit and previous_commit != dlc_state["commit"]:
+        changed_names = get_dlc_changed_names(repo_dir, dlc_state, previous_commit)
+        changed_count = "unknown" if changed_names is None else len(changed_names)
+        return (
+            f"Updated domain-list-community {previous_commit[:12]} -> {dlc_state['commit'][:12]}: "
+            f"changed_data_files={changed_count}"
+        )
+    return None
+
+
+def start_dlc_repo_sync(repo_dir, dlc_state):
+    """Run the DLC git sync on a background thread; ``ensure_dlc_repo_once`` joins it."""
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="dlc-sync")
+    dlc_state["sync"] = executor.submit(sync_dlc_repo, repo_dir, dlc_state)
+    executor.shutdown(wait=False)
 
 
 def ensure_dlc_repo_once(repo_dir, dlc_state):
-    if dlc_state["repo_ready"]:
+    sync = dlc_state.pop("sync", None)
+    message = sync.result() if sync is not None else None
+    if not dlc_state["repo_ready"]:
+        message = sync_dlc_repo(repo_dir, dlc_state)
+    if message:
+        print(message, flush=True)
+
+
+def get_dlc_changed_names(repo_dir, dlc_state, base_commit):
+    if not base_commit:
+        return None
+    if base_commit == dlc_state["commit"]:
+        return frozenset()
+    if "archive" in dlc_state:
+        return None
+
+    diffs = dlc_state.setdefault("diffs", {})
+    if base_commit not in diffs:
+        try:
+            result = run_command(
+                [
+                    "git",
+                    "diff",
+                    "--name-only",
+                    "--no-renames",
+                    base_commit,
+                    dlc_state["commit"],
+                    "--",
+                    "data/",
+                ],
+                cwd=repo_dir,
+            )
+        except RuleUpdateError:
+            diffs[base_commit] = None
+        else:
+            diffs[base_commit] = frozenset(
+                line.split("/", 1)[1] for line in result.stdout.splitlines() if line.startswith("data/")
+            )
+    return diffs[base_commit]
+
+
+def get_dlc_index_path(repo_dir):
+    return repo_dir.with_name(f"{repo_dir.name}.index.pickle")
+
+
+@functools.cache
+def get_dlc_parser_fingerprint():
+    """Hash only the code that shapes DLC index entries, not output options or other modules."""
+    digest = hashlib.sha256()
+    for function in (
+        read_protobuf_varint,
+        iter_protobuf_fields,
+        parse_geosite_rules,
+        parse_dlc_archive_entries,
+        strip_dlc_comment,
+        parse_dlc_rule_token,
+        parse_dlc_text,
+        dlc_rule_matches,
+        resolve_dlc_rules,
+        resolve_dlc_index_names,
+    ):
+        digest.update(inspect.getsource(function).encode("utf-8"))
+    digest.update(repr(sorted(GEOSITE_DOMAIN_TYPES.items())).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def load_dlc_index(index_path):
+    try:
+        with index_path.open("rb") as f:
+            index = pickle.load(f)
+    except (OSError, EOFError, AttributeError, ValueError, pickle.UnpicklingError):
+        return None
+    if (
+        not isinstance(index, dict)
+        or index.get("version") != DLC_INDEX_VERSION
+        or index.get("parser") != get_dlc_parser_fingerprint()
+    ):
+        return None
+    return index
+
+
+def save_dlc_index(index_path, index):
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = index_path.with_name(f".{index_path.name}.tmp")
+    with temp_path.open("wb") as f:
+        pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+    temp_path.replace(index_path)
+
+
+def resolve_dlc_index_names(dlc_names, repo_dir, parsed_files, dlc_cache, dlc_deps, dlc_errors):
+    for dlc_name in dlc_names:
+        if dlc_name in dlc_errors:
+            continue
+        if dlc_name not in parsed_files and not (repo_dir / "data" / dlc_name).is_file():
+            continue
+        try:
+            resolve_dlc_rules(
+                dlc_name,
+                dlc_cache,
+                repo_dir,
+                dlc_deps=dlc_deps,
+                parsed_files=parsed_files,
+                dlc_errors=dlc_errors,
+            )
+        except (RuleUpdateError, ValueError) as exc:
+            dlc_errors[dlc_name] = str(exc)
+
+
+def build_dlc_index(repo_dir, commit, archive=None):
+    dlc_cache = {}
+    dlc_deps = {}
+    dlc_errors = {}
+    if archive is None:
+        parsed_files = {}
+        dlc_names = sorted(
+            file_path.name for file_path in (repo_dir / "data").iterdir() if file_path.is_file()
+        )
+    else:
+        parsed_files = parse_dlc_archive_entries(archive, archive["entries"], dlc_errors)
+        dlc_names = sorted(parsed_files)
+    resolve_dlc_index_names(dlc_names, repo_dir, parsed_files, dlc_cache, dlc_deps, dlc_errors)
+    index = {
+        "version": DLC_INDEX_VERSION,
+        "commit": commit,
+        "parser": get_dlc_parser_fingerprint(),
+        "files": parsed_files,
+        "resolved": dlc_cache,
+        "deps": dlc_deps,
+        "errors": dlc_errors,
+    }
+    if archive is not None:
+        index["hashes"] = archive["hashes"]
+    return index
+
+
+def get_dlc_archive_changed_names(archive, index):
+    previous_hashes = index.get("hashes") if index else None
+    if previous_hashes is None:
+        return None
+    dlc_names = previous_hashes.keys() | archive["hashes"].keys()
+    return frozenset(name for name in dlc_names if previous_hashes.get(name) != archive["hashes"].get(name))
+
+
+def collect_dlc_dependents(parsed_files, dlc_names):
+    reverse_includes = {}
+    for dlc_name, (includes, _rules) in parsed_files.items():
+        for include_name, _include_filters in includes:
+            reverse_includes.setdefault(include_name, set()).add(dlc_name)
+
+    dependents = set()
+    pending = list(dlc_names)
+    while pending:
+        dlc_name = pending.pop()
+        if dlc_name in dependents:
+            continue
+        dependents.add(dlc_name)
+        pending.extend(reverse_includes.get(dlc_name, ()))
+    return dependents
+
+
+def update_dlc_index(index, repo_dir, commit, changed_names, archive=None):
+    invalidated = collect_dlc_dependents(index["files"], changed_names)
+    parsed_files = {name: parsed for name, parsed in index["files"].items() if name not in changed_names}
+    dlc_errors = {name: error for name, error in index["errors"].items() if name not in invalidated}
+    if archive is not None:
+        parsed_files.update(parse_dlc_archive_entries(archive, sorted(changed_names), dlc_errors))
+    dlc_cache = {name: rules for name, rules in index["resolved"].items() if name not in invalidated}
+    dlc_deps = {name: deps for name, deps in index["deps"].items() if name not in invalidated}
+    resolve_dlc_index_names(sorted(invalidated), repo_dir, parsed_files, dlc_cache, dlc_deps, dlc_errors)
+    updated_index = {
+        **index,
+        "commit": commit,
+        "files": parsed_files,
+        "resolved": dlc_cache,
+        "deps": dlc_deps,
+        "errors": dlc_errors,
+    }
+    if archive is not None:
+        updated_index["hashes"] = archive["hashes"]
+    return updated_index, invalidated
+
+
+def prepare_dlc_cache(repo_dir, dlc_cache, dlc_state):
+    ensure_dlc_repo_once(repo_dir, dlc_state)
+    if dlc_state.get("index_loaded"):
         return
-    ensure_dlc_repo(repo_dir)
-    dlc_state["repo_ready"] = True
+    dlc_state["index_loaded"] = True
+
+    commit = dlc_state["commit"]
+    index_path = get_dlc_index_path(repo_dir)
+    index = load_dlc_index(index_path)
+    if index is None or index.get("commit") != commit:
+        started_at = time.perf_counter()
+        archive = dlc_state.get("archive")
+        if archive is not None:
+            changed_names = get_dlc_archive_changed_names(archive, index)
+        else:
+            changed_names = get_dlc_changed_names(repo_dir, dlc_state, index.get("commit")) if index else None
+        if changed_names is None:
+            index = build_dlc_index(repo_dir, commit, archive)
+            summary = f"rebuilt files={len(index['files'])}"
+        else:
+            index, invalidated = update_dlc_index(index, repo_dir, commit, changed_names, archive)
+            summary = f"changed={len(changed_names)}, invalidated={len(invalidated)}"
+        save_dlc_index(index_path, index)
+        print(
+            f"Updated DLC index for commit {commit[:12]}: {summary}, "
+            f"resolved={len(index['resolved'])} in {time.perf_counter() - started_at:.2f}s",
+            flush=True,
+        )
+    for dlc_name, rules in index["resolved"].items():
+        dlc_cache.setdefault(dlc_name, rules)
+    for dlc_name, deps in index["deps"].items():
+        dlc_state["deps"].setdefault(dlc_name, deps)
+    dlc_state.setdefault("errors", {}).update(index["errors"])
 
 
 def read_dlc_data_file(dlc_name, repo_dir):
@@ -284,31 +1047,66 @@ def dlc_rule_matches(rule_attributes, include_filters):
     return True
 
 
-def resolve_dlc_rules(dlc_name, dlc_cache, repo_dir, include_stack=None, text=None):
+def resolve_dlc_rules(
+    dlc_name,
+    dlc_cache,
+    repo_dir,
+    include_stack=None,
+    text=None,
+    dlc_deps=None,
+    parsed_files=None,
+    dlc_errors=None,
+):
     include_stack = include_stack or []
     if dlc_name in include_stack:
         chain = " -> ".join([*include_stack, dlc_name])
         raise RuleUpdateError(f"Cyclic DLC include detected: {chain}")
-    if dlc_name in dlc_cache:
+    downloaded = text is not None
+    if not downloaded and dlc_name in dlc_cache:
         return dlc_cache[dlc_name]
+    if not downloaded and dlc_errors and dlc_name in dlc_errors:
+        # Recorded while building the index; an archive has no data file to re-read for the real error.
+        raise RuleUpdateError(dlc_errors[dlc_name])
 
-    if text is None:
-        text = read_dlc_data_file(dlc_name, repo_dir)
-    includes, rules = parse_dlc_text(text, f"domain-list-community/data/{dlc_name}")
+    if not downloaded and parsed_files is not None and dlc_name in parsed_files:
+        includes, rules = parsed_files[dlc_name]
+    else:
+        if text is None:
+            text = read_dlc_data_file(dlc_name, repo_dir)
+        includes, rules = parse_dlc_text(text, f"domain-list-community/data/{dlc_name}")
+        if parsed_files is not None:
+            parsed_files[dlc_name] = (tuple(includes), tuple(rules))
     resolved_rules = list(rules)
+    resolved_deps = {dlc_name}
     next_stack = [*include_stack, dlc_name]
     for include_name, include_filters in includes:
-        for rule in resolve_dlc_rules(include_name, dlc_cache, repo_dir, next_stack):
+        for rule in resolve_dlc_rules(
+            include_name,
+            dlc_cache,
+            repo_dir,
+            next_stack,
+            dlc_deps=dlc_deps,
+            parsed_files=parsed_files,
+            dlc_errors=dlc_errors,
+        ):
             if dlc_rule_matches(rule[2], include_filters):
                 resolved_rules.append(rule)
-
+        if dlc_deps is not None:
+            resolved_deps.update(dlc_deps.get(include_name, ()))
+
+    if downloaded:
+        # Downloaded text wins for this source only; the cache keeps the repository version.
+        if dlc_deps is not None:
+            dlc_deps.setdefault(dlc_name, frozenset(resolved_deps))
+        return tuple(resolved_rules)
     dlc_cache[dlc_name] = tuple(resolved_rules)
+    if dlc_deps is not None:
+        dlc_deps[dlc_name] = frozenset(resolved_deps)
     return dlc_cache[dlc_name]
 
 
 def convert_dlc_rules_to_clash(rules, url):
     payload = []
-    converted_regexps = 0
     for rule_type, value, _attributes in rules:
         if rule_type == "domain":
             payload.append(f"DOMAIN-SUFFIX,{value}")
@@ -318,15 +1116,9 @@ def convert_dlc_rules_to_clash(rules, url):
             payload.append(f"DOMAIN-KEYWORD,{value}")
         elif rule_type == "regexp":
             payload.append(f"DOMAIN-REGEX,{value}")
-            converted_regexps += 1
         else:
             raise RuleUpdateError(f"Unsupported resolved DLC rule type {rule_type!r} from {url}")
 
-    if converted_regexps:
-        print(
-            f"Converted {converted_regexps} regexp rules from DLC source {url} to DOMAIN-REGEX",
-            flush=True,
-        )
     if not payload:
         raise RuleUpdateError(f"DLC source produced no convertible Clash rules: {url}")
     return payload
@@ -356,42 +1148,100 @@ def download_dlc_payload(source_item, dlc_cache, repo_dir, dlc_state, text=None)
         raise RuleUpdateError(
             f"DLC source must either point to a /data/ URL or define a name: {source_item['url']}"
         )
-    if text is None:
-        ensure_dlc_repo_once(repo_dir, dlc_state)
-        rules = resolve_dlc_rules(dlc_name, dlc_cache, repo_dir)
-    else:
-        ensure_dlc_repo_once(repo_dir, dlc_state)
-        rules = resolve_dlc_rules(dlc_name, dlc_cache, repo_dir, text=text)
+    prepare_dlc_cache(repo_dir, dlc_cache, dlc_state)
+    rules = resolve_dlc_rules(
+        dlc_name,
+        dlc_cache,
+        repo_dir,
+        text=text,
+        dlc_deps=dlc_state["deps"],
+        dlc_errors=dlc_state.get("errors"),
+    )
     return convert_dlc_rules_to_clash(rules, source_item["url"])
 
 
-def download_payload(source_item, dlc_cache, repo_dir, dlc_state, downloaded_texts=None):
+def get_payload_cache_key(source_item):
+    if source_item["format"] == "dlc":
+        return source_item.get("name") or infer_dlc_name(source_item["url"]) or source_item["url"], "dlc"
+    return source_item["url"], source_item["format"]
+
+
+def download_payload(
+    source_item, dlc_cache, repo_dir, dlc_state, downloaded_texts=None, source_traces=None, payload_cache=None
+):
+    """Return the parsed payload of one source item as a tuple.
+
+    With ``payload_cache``, each URL (or DLC name) is parsed and converted once
+    per run and every later node gets the same tuple back. The DLC regexp
+    conversion note is printed on cache hits too, so each node's log is the
+    same whichever node or worker filled the cache.
+    """
+    started_at = time.time()
+    cache_key = get_payload_cache_key(source_item)
+    cached = payload_cache.get(cache_key) if payload_cache is not None else None
+    if cached is None:
+        payload, detected_format = load_source_payload(
+            source_item, dlc_cache, repo_dir, dlc_state, downloaded_texts
+        )
+        converted_regexps = 0
+        if detected_format == "dlc":
+            converted_regexps = sum(item.startswith("DOMAIN-REGEX,") for item in payload)
+        cached = (tuple(payload), detected_format, converted_regexps)
+        if payload_cache is not None:
+            payload_cache[cache_key] = cached
+        cache_hit = False
+    else:
+        cache_hit = True
+    payload, detected_format, converted_regexps = cached
+    if converted_regexps:
+        print(
+            f"Converted {converted_regexps} regexp rules from DLC source {source_item['url']} to DOMAIN-REGEX",
+            flush=True,
+        )
+    if source_traces is not None:
+        source_traces.append(
+            {
+                "url": source_item["url"],
+                "format": detected_format,
+                "rules": len(payload),
+                "cached": cache_hit,
+                "seconds": time.time() - started_at,
+            }
+        )
+    return payload
+
+
+def load_source_payload(source_item, dlc_cache, repo_dir, dlc_state, downloaded_texts=None):
     url = source_item["url"]
     source_format = source_item["format"]
 
     if source_format == "dlc":
-        return download_dlc_payload(source_item, dlc_cache, repo_dir, dlc_state)
+        return download_dlc_payload(source_item, dlc_cache, repo_dir, dlc_state), "dlc"
 
     if downloaded_texts is not None and url in downloaded_texts:
         text = downloaded_texts[url]
     else:
         text = get_url_text(url)
     if source_format == "auto" and is_dlc_data_url(url):
-        return download_dlc_payload(source_item, dlc_cache, repo_dir, dlc_state, text=text)
+        return download_dlc_payload(source_item, dlc_cache, repo_dir, dlc_state, text=text), "dlc"
+
+    payload = parse_payload_text(text)
+    if payload is not None:
+        return payload, "clash-lines"
 
     try:
         data = yaml_load(text)
     except yaml.YAMLError as exc:
         if source_format == "auto" and looks_like_dlc_text(text):
-            return download_dlc_payload(source_item, dlc_cache, repo_dir, dlc_state, text=text)
+            return download_dlc_payload(source_item, dlc_cache, repo_dir, dlc_state, text=text), "dlc"
         raise RuleUpdateError(f"Invalid YAML downloaded from {url}: {exc}") from exc
 
     if isinstance(data, dict) and "payload" in data:
-        return validate_payload(data, url)
+        return validate_payload(data, url), "clash-yaml"
     if source_format == "clash":
         raise RuleUpdateError(f"Downloaded Clash source has no payload node: {url}")
     if source_format == "auto" and looks_like_dlc_text(text):
-        return download_dlc_payload(source_item, dlc_cache, repo_dir, dlc_state, text=text)
+        return download_dlc_payload(source_item, dlc_cache, repo_dir, dlc_state, text=text), "dlc"
 
     raise RuleUpdateError(f"Downloaded content is neither Clash YAML payload nor supported DLC data: {url}")
 
@@ -457,34 +1307,109 @@ def download_url_task(url):
     return get_url_text(url, get_thread_session())
 
 
-def download_all_texts(urls):
-    if not urls:
-        return {}, 0.0
+def report_download_result(url, on_done, future):
+    try:
+        text = future.result()
+    except Exception as exc:
+        on_done(url, None, exc)
+    else:
+        on_done(url, text, None)
 
-    started_at = time.perf_counter()
+
+def start_text_downloads_threaded(urls, on_done):
     workers = min(get_download_workers(), len(urls))
-    downloaded = {}
-    failures = []
-    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
-        future_to_url = {executor.submit(download_url_task, url): url for url in urls}
-        for future in concurrent.futures.as_completed(future_to_url):
-            url = future_to_url[future]
-            try:
-                downloaded[url] = future.result()
-            except Exception as exc:
-                failures.append((url, exc))
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+    for url in urls:
+        executor.submit(download_url_task, url).add_done_callback(
+            functools.partial(report_download_result, url, on_done)
+        )
+
+    def finish(cancel=False):
+        executor.shutdown(wait=not cancel, cancel_futures=cancel)
+        return f"with {workers} worker(s)"
+
+    return finish
+
+
+async def download_texts_async(urls, on_done, client=None):
+    host_connections = get_host_connections()
+    hosts = {urlparse(url).netloc for url in urls}
+    hosts.update(urlparse(get_github_raw_fallback_url(url) or url).netloc for url in urls)
+    host_limits = {}
+    summary = f"with async engine ({host_connections} connection(s) per host)"
+    owns_client = client is None
+    if owns_client:
+        client, http2 = create_async_client(len(hosts), host_connections)
+        summary = (
+            f"with async engine ({host_connections} connection(s) per host, "
+            f"http2={'on' if http2 else 'off'})"
+        )
+
+    async def download(url):
+        try:
+            text = await get_url_text_async(url, client, host_limits, host_connections)
+        except Exception as exc:
+            on_done(url, None, exc)
+        else:
+            on_done(url, text, None)
+
+    try:
+        await asyncio.gather(*(download(url) for url in urls))
+    finally:
+        if owns_client:
+            await client.aclose()
+    return summary
+
+
+def start_text_downloads_async(urls, on_done):
+    if httpx is None:
+        raise RuleUpdateError('RULE_DOWNLOAD_ENGINE=async requires httpx: pip install "httpx[http2]"')
+
+    reported = set()
+    outcome = {}
+
+    def report(url, text, error):
+        reported.add(url)
+        on_done(url, text, error)
+
+    def run():
+        try:
+            outcome["summary"] = asyncio.run(download_texts_async(urls, report))
+        except Exception as exc:
+            for url in urls:
+                if url not in reported:
+                    on_done(url, None, exc)
 
-    elapsed = time.perf_counter() - started_at
-    if failures:
-        lines = [f"Failed to download {len(failures)} source URL(s):"]
-        for url, exc in failures[:20]:
-            lines.append(f"- {url}: {exc}")
-        if len(failures) > 20:
-            lines.append(f"- ... {len(failures) - 20} more")
-        raise RuleUpdateError("\n".join(lines))
+    thread = threading.Thread(target=run, name="rule-downloads", daemon=True)
+    thread.start()
 
-    print(f"Downloaded {len(downloaded)} unique URL(s) with {workers} worker(s) in {elapsed:.2f}s", flush=True)
-    return downloaded, elapsed
+    def finish(cancel=False):
+        if not cancel:
+            thread.join()
+        return outcome.get("summary", "with async engine")
+
+    return finish
+
+
+def start_text_downloads(urls, on_done):
+    """Download ``urls`` in the background, calling ``on_done(url, text, error)`` as each one finishes.
+
+    ``on_done`` runs on a download thread. Returns ``finish(cancel=False)``,
+    which waits for the downloads and returns the engine summary for the log.
+    """
+    reset_http_cache_stats()
+    if get_download_engine() == "async":
+        return start_text_downloads_async(urls, on_done)
+    return start_text_downloads_threaded(urls, on_done)
+
+
+def format_download_failures(failures):
+    lines = [f"Failed to download {len(failures)} source URL(s):"]
+    for url, exc in failures[:20]:
+        lines.append(f"- {url}: {exc}")
+    if len(failures) > 20:
+        lines.append(f"- ... {len(failures) - 20} more")
+    return "\n".join(lines)
 
 
 def dedupe_keep_order(items):
@@ -497,132 +1422,181 @@ def dedupe_keep_order(items):
     return result
 
 
-def parse_domain_rule(item):
-    if not isinstance(item, str):
-        return None
-    parts = item.split(",", 2)
-    if len(parts) < 2:
-        return None
-    rule_type = parts[0]
-    if rule_type not in {"DOMAIN", "DOMAIN-SUFFIX"}:
-        return None
-    domain = parts[1].strip().lower().rstrip(".")
-    if not domain:
-        return None
-    return rule_type, domain
-
-
-def covered_by_suffix(domain, suffixes, include_self):
-    labels = domain.split(".")
-    start_index = 0 if include_self else 1
-    for index in range(start_index, len(labels)):
-        suffix = ".".join(labels[index:])
-        if suffix in suffixes:
-            return True
-    return False
+def parse_rule_records(items):
+    return dedupe_keep_order(parse_rule(item) for item in items)
 
 
-def remove_covered_domain_rules(items):
-    suffixes = {
-        parsed[1]
-        for parsed in (parse_domain_rule(item) for item in items)
-        if parsed and parsed[0] == "DOMAIN-SUFFIX"
-    }
-    if not suffixes:
-        return items, 0
+def remove_covered_domain_rules(records):
+    suffix_trie = DomainSuffixTrie(
+        record.value for record in records if record.rule_type == "DOMAIN-SUFFIX" and record.value
+    )
+    if not suffix_trie:
+        return records, 0
 
     result = []
     removed_count = 0
-    for item in items:
-        parsed = parse_domain_rule(item)
-        if not parsed:
-            result.append(item)
-            continue
-
-        rule_type, domain = parsed
-        if rule_type == "DOMAIN" and covered_by_suffix(domain, suffixes, include_self=True):
+    for record in records:
+        if (
+            record.rule_type == "DOMAIN"
+            and record.value
+            and suffix_trie.covers(record.value, include_self=True)
+        ):
             removed_count += 1
             continue
-        if rule_type == "DOMAIN-SUFFIX" and covered_by_suffix(domain, suffixes, include_self=False):
+        if (
+            record.rule_type == "DOMAIN-SUFFIX"
+            and record.value
+            and suffix_trie.covers(record.value, include_self=False)
+        ):
             removed_count += 1
             continue
-        result.append(item)
+        result.append(record)
 
     return result, removed_count
 
 
-def parse_ip_rule(item):
-    if not isinstance(item, str):
-        return None
-    parts = item.split(",")
-    if len(parts) < 2 or parts[0] not in {"IP-CIDR", "IP-CIDR6"}:
-        return None
-
-    try:
-        network = ipaddress.ip_network(parts[1].strip(), strict=False)
-    except ValueError:
-        return None
+def remove_covered_ip_rules(records, aggregate=False):
+    grouped_records = {}
+    for index, record in enumerate(records):
+        network = record.network
+        if network is not None:
+            grouped_records.setdefault((record.rule_type, network.version, record.options), []).append(index)
 
-    options = tuple(part.strip().lower() for part in parts[2:])
-    return parts[0], network, options
+    if not grouped_records:
+        return records, 0
 
+    replacements = {}
+    for (rule_type, _version, options), indexes in grouped_records.items():
+        intervals = [
+            (
+                int(records[index].network.network_address),
+                int(records[index].network.broadcast_address),
+                records[index].network.prefixlen,
+            )
+            for index in indexes
+        ]
+        covered_positions = find_covered_intervals(intervals)
+        for position in covered_positions:
+            replacements[indexes[position]] = None
+        if not aggregate:
+            continue
 
-def remove_covered_ip_rules(items):
-    parsed_items = []
-    for item in items:
-        parsed = parse_ip_rule(item)
-        if parsed:
-            parsed_items.append((item, *parsed))
-
-    if not parsed_items:
-        return items, 0
-
-    covered_items = set()
-    grouped_networks = {}
-    for item, rule_type, network, options in parsed_items:
-        grouped_networks.setdefault((rule_type, network.version, options), []).append((item, network))
-
-    for grouped_items in grouped_networks.values():
-        seen_networks = set()
-        for item, network in sorted(
-            grouped_items,
-            key=lambda item_and_network: (
-                item_and_network[1].prefixlen,
-                int(item_and_network[1].network_address),
-                int(item_and_network[1].broadcast_address),
-                item_and_network[0],
-            ),
+        kept_positions = [position for position in range(len(indexes)) if position not in covered_positions]
+        network_class = type(records[indexes[0]].network)
+        max_prefixlen = records[indexes[0]].network.max_prefixlen
+        for block_start, prefixlen, members in collapse_intervals(
+            [intervals[position] for position in kept_positions], max_prefixlen
         ):
-            for prefixlen in range(network.prefixlen):
-                if network.supernet(new_prefix=prefixlen) in seen_networks:
-                    covered_items.add(item)
-                    break
-            seen_networks.add(network)
+            if all(intervals[kept_positions[member]][2] == prefixlen for member in members):
+                continue
+            member_indexes = sorted(indexes[kept_positions[member]] for member in members)
+            block = network_class((block_start, prefixlen))
+            value = format_network(block)
+            text = format_rule(rule_type, value, options)
+            replacements[member_indexes[0]] = RuleRecord(rule_type, value, options, text, text, block)
+            for member_index in member_indexes[1:]:
+                replacements[member_index] = None
 
-    if not covered_items:
-        return items, 0
+    if not replacements:
+        return records, 0
 
-    return [item for item in items if item not in covered_items], len(covered_items)
+    result = []
+    for index, record in enumerate(records):
+        if index in replacements:
+            record = replacements[index]
+            if record is None:
+                continue
+        result.append(record)
+    return result, len(records) - len(result)
 
 
-def parse_rule_item(item):
-    if not isinstance(item, str):
-        return None, "", ()
-    parts = item.split(",")
-    rule_type = parts[0]
-    values = tuple(part.strip() for part in parts[1:])
-    return rule_type, values[0] if values else "", values
+def rule_sort_key(index_and_record):
+    index, record = index_and_record
+    rank = RULE_TYPE_ORDER.get(record.rule_type, 1000)
+    return rank, index
 
 
-def rule_sort_key(index_and_item):
-    index, item = index_and_item
-    rule_type, _value, _values = parse_rule_item(item)
-    rank = RULE_TYPE_ORDER.get(rule_type, 1000)
-    return rank, index
+def sort_rule_payload(records):
+    return [record.text for _index, record in sorted(enumerate(records), key=rule_sort_key)]
+
+
+def add_no_resolve_option(item):
+    rule_type, _separator, rest = item.partition(",")
+    if rule_type.strip().upper() not in NO_RESOLVE_RULE_TYPES or not rest:
+        return item
+    options = [option.strip().lower() for option in rest.split(",")[1:]]
+    if NO_RESOLVE_OPTION in options:
+        return item
+    return f"{item},{NO_RESOLVE_OPTION}"
+
+
+def derive_no_resolve_payload(payload, aggregate_ip):
+    """Build a no-resolve payload from a processed normal one.
+
+    IP-type rules get ``no-resolve`` appended, then the IP cover pass runs
+    again because rules that only differed by that option now overlap.
+    """
+    derived_payloads = [add_no_resolve_option(item) for item in payload]
+    deduped_records = parse_rule_records(dedupe_keep_order(derived_payloads))
+    cleaned_records, removed_ip_covered = remove_covered_ip_rules(deduped_records, aggregate=aggregate_ip)
+    merged_payloads = sort_rule_payload(cleaned_records)
+    node_stats = {
+        "source": len(derived_payloads),
+        "deduped": len(merged_payloads),
+        "duplicates": len(derived_payloads) - len(deduped_records),
+        "covered": 0,
+        "ip_covered": removed_ip_covered,
+    }
+    return merged_payloads, node_stats
+
+
+def get_node_settings(node_data):
+    return {key: value for key, value in node_data.items() if key not in {"urls", "path"}}
+
+
+def get_resolving_source_item(source_item):
+    return {**source_item, "url": NO_RESOLVE_URL_PATTERN.sub(r"\1", source_item["url"])}
+
 
+def map_no_resolve_bases(source_entries):
+    """Pair each ``no_resolve`` node with the normal node it mirrors.
 
-def sort_rule_payload(items):
-    return [item for _index, item in sorted(enumerate(items), key=rule_sort_key)]
+    A node mirrors another when it has the same name and settings and its URLs
+    are the normal ones with ``_No_Resolve`` before the extension (DLC URLs are
+    shared as-is). Returns ``{position in source_entries: base entry}``.
+    """
+    base_entries = {entry["node_name"]: entry for entry in source_entries if not entry["subpath"]}
+    bases = {}
+    for position, entry in enumerate(source_entries):
+        if entry["subpath"] != NO_RESOLVE_SUBPATH:
+            continue
+        base_entry = base_entries.get(entry["node_name"])
+        if base_entry is None:
+            continue
+        if get_node_settings(entry["node_data"]) != get_node_settings(base_entry["node_data"]):
+            continue
+        if [get_resolving_source_item(item) for item in entry["source_items"]] == base_entry["source_items"]:
+            bases[position] = base_entry
+    return bases
+
+
+def report_no_resolve_diff(rule_rel_path, derived_payloads, source_payloads):
+    if derived_payloads == source_payloads:
+        return False
+    derived_items = set(derived_payloads)
+    source_items = set(source_payloads)
+    missing = [item for item in source_payloads if item not in derived_items]
+    extra = [item for item in derived_payloads if item not in source_items]
+    print(
+        f"No-resolve mismatch {rule_rel_path}: missing={len(missing)}, extra={len(extra)}"
+        + (", order differs" if not missing and not extra else ""),
+        flush=True,
+    )
+    for item in missing[:NO_RESOLVE_DIFF_EXAMPLES]:
+        print(f"  - {item}", flush=True)
+    for item in extra[:NO_RESOLVE_DIFF_EXAMPLES]:
+        print(f"  + {item}", flush=True)
+    return True
 
 
 def normalize_index_name(subpath):
@@ -631,21 +1605,120 @@ def normalize_index_name(subpath):
     return f"rules_{subpath.replace(os.sep, '_')}.yaml"
 
 
-def build_rule_entry(node_name, node_data, subpath):
-    if subpath:
-        yaml_path = f"./rules_set/{subpath}/{node_name}.yaml"
-        yaml_url = f"{REPO_RAW_BASE}/{subpath}/{node_name}.yaml"
-    else:
-        yaml_path = f"./rules_set/{node_name}.yaml"
-        yaml_url = f"{REPO_RAW_BASE}/{node_name}.yaml"
+def build_rule_entry(node_name, node_data, subpath, file_name=None, behavior=None, rule_format=None):
+    file_name = file_name or f"{node_name}.yaml"
+    rel_path = f"{subpath}/{file_name}" if subpath else file_name
 
-    return {
+    entry = {
         "type": node_data.get("type"),
-        "behavior": node_data.get("behavior"),
-        "path": yaml_path,
-        "interval": node_data.get("interval", 86400),
-        "url": yaml_url,
+        "behavior": behavior or node_data.get("behavior"),
     }
+    if rule_format:
+        entry["format"] = rule_format
+    entry.update(
+        path=f"./rules_set/{rel_path}",
+        interval=node_data.get("interval", 86400),
+        url=f"{REPO_RAW_BASE}/{rel_path}",
+    )
+    return entry
+
+
+def get_behavior_rel_path(rule_rel_path, behavior, suffix):
+    path = Path(rule_rel_path)
+    return path.with_name(f"{path.stem}_{behavior}{suffix}").as_posix()
+
+
+def add_extra_index_entries(generated_indexes, extra_outputs_by_path, omitted_paths=frozenset()):
+    extras_by_index = {}
+    for rule_rel_path, extra_outputs in extra_outputs_by_path.items():
+        if not extra_outputs and rule_rel_path not in omitted_paths:
+            continue
+        path = Path(rule_rel_path)
+        subpath = "" if path.parent == Path(".") else path.parent.as_posix()
+        extras_by_index.setdefault(normalize_index_name(subpath), {})[path.stem] = (
+            subpath,
+            extra_outputs,
+            rule_rel_path in omitted_paths,
+        )
+
+    for index_name, node_extras in extras_by_index.items():
+        index_data = {}
+        for node_name, rule_entry in generated_indexes[index_name].items():
+            subpath, extra_outputs, omitted = node_extras.get(node_name, ("", (), False))
+            if not omitted:
+                index_data[node_name] = rule_entry
+            for extra in extra_outputs:
+                rule_format = None if extra["format"] == "yaml" else extra["format"]
+                entry_name = f"{node_name}_{extra['behavior']}" + (f"_{rule_format}" if rule_format else "")
+                if entry_name in generated_indexes[index_name] or entry_name in index_data:
+                    raise RuleUpdateError(
+                        f"Index entry {entry_name!r} for {extra['path']} collides with an existing entry "
+                        f"in {index_name}"
+                    )
+                index_data[entry_name] = build_rule_entry(
+                    node_name,
+                    rule_entry,
+                    subpath,
+                    file_name=Path(extra["path"]).name,
+                    behavior=extra["behavior"],
+                    rule_format=rule_format,
+                )
+        generated_indexes[index_name] = index_data
+
+
+def add_derived_outputs(
+    generated_rules, generated_indexes, build_manifest, mrs_enabled=False, split_enabled=False
+):
+    """Derive per-behavior outputs from the final classical payloads.
+
+    ``.mrs`` rule sets are returned as binaries to convert; split YAML providers
+    are added to ``generated_rules``, and a node whose rules all moved into
+    them loses its classical file and index entry.
+    """
+    generated_binaries = {}
+    extra_outputs_by_path = {}
+    omitted_paths = set()
+    for rule_rel_path, manifest_entry in build_manifest.items():
+        if rule_rel_path in generated_rules:
+            behavior_payloads = split_behavior_payloads(generated_rules[rule_rel_path]["payload"])
+            extra_outputs = []
+            for behavior in BEHAVIOR_PROVIDERS:
+                payload = behavior_payloads[behavior]
+                if not payload:
+                    continue
+                if mrs_enabled:
+                    mrs_rel_path = get_behavior_rel_path(rule_rel_path, behavior, ".mrs")
+                    generated_binaries[mrs_rel_path] = {"behavior": behavior, "payload": payload}
+                    extra_outputs.append({"behavior": behavior, "format": "mrs", "path": mrs_rel_path})
+                if split_enabled:
+                    yaml_rel_path = get_behavior_rel_path(rule_rel_path, behavior, ".yaml")
+                    if yaml_rel_path in build_manifest or yaml_rel_path in MANUAL_RULE_PATHS:
+                        raise RuleUpdateError(
+                            f"Split output {yaml_rel_path} of {rule_rel_path} "
+                            "collides with an existing rule file"
+                        )
+                    generated_rules[yaml_rel_path] = {"payload": payload}
+                    extra_outputs.append(
+                        {
+                            "behavior": behavior,
+                            "format": "yaml",
+                            "path": yaml_rel_path,
+                            "sha256": hash_text(render_payload(payload)),
+                        }
+                    )
+            manifest_entry["extra_outputs"] = extra_outputs
+            manifest_entry["classical"] = True
+            if split_enabled:
+                if behavior_payloads["classical"]:
+                    generated_rules[rule_rel_path] = {"payload": behavior_payloads["classical"]}
+                else:
+                    del generated_rules[rule_rel_path]
+                    manifest_entry["classical"] = False
+        extra_outputs_by_path[rule_rel_path] = manifest_entry.get("extra_outputs", [])
+        if manifest_entry.get("classical") is False:
+            omitted_paths.add(rule_rel_path)
+    add_extra_index_entries(generated_indexes, extra_outputs_by_path, omitted_paths)
+    return generated_binaries
 
 
 def normalize_source_item(file_path, node_name, item):
@@ -683,71 +1756,611 @@ def validate_source_node(file_path, node_name, node_data):
     return [normalize_source_item(file_path, node_name, item) for item in urls]
 
 
-def collect_generated_rules(source_dir):
+def get_pipeline_fingerprint():
+    digest = hashlib.sha256()
+    for file_path in PIPELINE_FILES:
+        digest.update(file_path.read_bytes())
+    options = {
+        "ip_aggregate": get_ip_aggregate_enabled(),
+        "weighting": get_weighting_enabled(),
+        "mrs": get_mrs_enabled(),
+        "split_behavior": get_split_behavior_enabled(),
+        "no_resolve_mode": get_no_resolve_mode(),
+    }
+    digest.update(json.dumps(options, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def load_build_manifest(manifest_path):
+    if not get_incremental_enabled():
+        return {}
+    try:
+        data = json.loads(manifest_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    if (
+        not isinstance(data, dict)
+        or data.get("version") != BUILD_MANIFEST_VERSION
+        or data.get("pipeline") != get_pipeline_fingerprint()
+        or not isinstance(data.get("nodes"), dict)
+    ):
+        return {}
+    return data["nodes"]
+
+
+def save_build_manifest(manifest_path, build_manifest):
+    data = {
+        "version": BUILD_MANIFEST_VERSION,
+        "pipeline": get_pipeline_fingerprint(),
+        "nodes": build_manifest,
+    }
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = manifest_path.with_name(f".{manifest_path.name}.tmp")
+    temp_path.write_text(json.dumps(data, ensure_ascii=False, indent=2, sort_keys=True), encoding="utf-8")
+    temp_path.replace(manifest_path)
+
+
+def fingerprint_source_node(entry):
+    config = {
+        "node_name": entry["node_name"],
+        "subpath": entry["subpath"],
+        "node_data": entry["node_data"],
+    }
+    return hash_text(json.dumps(config, ensure_ascii=False, sort_keys=True, default=str))
+
+
+def collect_node_text_inputs(source_items, downloaded_texts, text_hashes):
+    inputs = {}
+    for source_item in source_items:
+        url = source_item["url"]
+        if url not in downloaded_texts:
+            continue
+        if url not in text_hashes:
+            text_hashes[url] = hash_text(downloaded_texts[url])
+        inputs[url] = text_hashes[url]
+    return inputs
+
+
+def get_dlc_file_hash(dlc_name, repo_dir, dlc_state, dlc_file_hashes):
+    if "archive" in dlc_state:
+        return dlc_state["archive"]["hashes"].get(dlc_name)
+    if dlc_name not in dlc_file_hashes:
+        dlc_file_hashes[dlc_name] = hash_file(repo_dir / "data" / dlc_name)
+    return dlc_file_hashes[dlc_name]
+
+
+def get_source_dlc_names(source_items):
+    dlc_names = []
+    for source_item in source_items:
+        dlc_name = source_item.get("name") or infer_dlc_name(source_item["url"])
+        if dlc_name:
+            dlc_names.append(dlc_name)
+    return dlc_names
+
+
+def source_items_may_need_dlc(source_items):
+    for source_item in source_items:
+        if source_item["format"] == "dlc":
+            return True
+        if source_item["format"] == "auto" and is_dlc_data_url(source_item["url"]):
+            return True
+    return False
+
+
+def source_items_need_dlc(source_items, downloaded_texts):
+    for source_item in source_items:
+        url = source_item["url"]
+        if source_item["format"] == "dlc":
+            return True
+        if source_item["format"] == "auto" and (
+            is_dlc_data_url(url) or (url in downloaded_texts and looks_like_dlc_text(downloaded_texts[url]))
+        ):
+            return True
+    return False
+
+
+def collect_node_dlc_inputs(source_items, dlc_state, repo_dir, dlc_file_hashes):
+    dlc_names = set()
+    for dlc_name in get_source_dlc_names(source_items):
+        dlc_names.update(dlc_state["deps"].get(dlc_name, ()))
+    return {name: get_dlc_file_hash(name, repo_dir, dlc_state, dlc_file_hashes) for name in sorted(dlc_names)}
+
+
+def is_node_unchanged(previous, config_hash, text_inputs, output_path, repo_dir, dlc_state, dlc_file_hashes):
+    if not isinstance(previous, dict) or not isinstance(previous.get("stats"), dict):
+        return False
+    if previous.get("config") != config_hash or previous.get("inputs") != text_inputs:
+        return False
+    for extra in previous.get("extra_outputs", ()):
+        extra_path = output_path.parent / Path(extra["path"]).name
+        if not extra_path.exists() or ("sha256" in extra and hash_file(extra_path) != extra["sha256"]):
+            return False
+
+    dlc_inputs = previous.get("dlc") or {}
+    if dlc_inputs:
+        ensure_dlc_repo_once(repo_dir, dlc_state)
+        changed_names = get_dlc_changed_names(repo_dir, dlc_state, previous.get("dlc_commit"))
+        if changed_names is not None:
+            if not changed_names.isdisjoint(dlc_inputs):
+                return False
+        else:
+            for dlc_name, digest in dlc_inputs.items():
+                if get_dlc_file_hash(dlc_name, repo_dir, dlc_state, dlc_file_hashes) != digest:
+                    return False
+
+    if previous.get("classical") is False:
+        return True
+    payload_hash = previous.get("payload_sha256")
+    return payload_hash is not None and hash_file(output_path) == payload_hash
+
+
+def process_source_node(
+    source_items, dlc_cache, repo_dir, dlc_state, downloaded_texts, aggregate_ip, payload_cache=None
+):
+    node_trace = {"start": time.time(), "pid": os.getpid(), "sources": [], "stages": {}}
+    stage_started_at = time.perf_counter()
+
+    def finish_stage(stage_name):
+        nonlocal stage_started_at
+        now = time.perf_counter()
+        node_trace["stages"][stage_name] = now - stage_started_at
+        stage_started_at = now
+
+    downloaded_payloads = []
+    for source_item in source_items:
+        downloaded_payloads.extend(
+            download_payload(
+                source_item,
+                dlc_cache,
+                repo_dir,
+                dlc_state,
+                downloaded_texts,
+                node_trace["sources"],
+                payload_cache,
+            )
+        )
+    finish_stage("load")
+
+    deduped_records = parse_rule_records(dedupe_keep_order(downloaded_payloads))
+    finish_stage("dedupe")
+    cleaned_records, removed_covered = remove_covered_domain_rules(deduped_records)
+    finish_stage("domain_cover")
+    cleaned_records, removed_ip_covered = remove_covered_ip_rules(cleaned_records, aggregate=aggregate_ip)
+    finish_stage("ip_cover")
+    merged_payloads = sort_rule_payload(cleaned_records)
+    finish_stage("sort")
+    node_trace["duration"] = time.time() - node_trace["start"]
+
+    source_count = len(downloaded_payloads)
+    node_stats = {
+        "source": source_count,
+        "deduped": len(merged_payloads),
+        "duplicates": source_count - len(deduped_records),
+        "covered": removed_covered,
+        "ip_covered": removed_ip_covered,
+    }
+    return merged_payloads, node_stats, node_trace
+
+
+def process_source_node_task(source_items, downloaded_texts, repo_dir, repo_commit, aggregate_ip):
+    if repo_commit is not None and not WORKER_DLC_STATE["repo_ready"]:
+        WORKER_DLC_STATE["commit"] = repo_commit
+        WORKER_DLC_STATE["repo_ready"] = True
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        merged_payloads, node_stats, node_trace = process_source_node(
+            source_items,
+            WORKER_DLC_CACHE,
+            repo_dir,
+            WORKER_DLC_STATE,
+            downloaded_texts,
+            aggregate_ip,
+            WORKER_PAYLOAD_CACHE,
+        )
+    dlc_deps = {
+        dlc_name: WORKER_DLC_STATE["deps"][dlc_name]
+        for dlc_name in get_source_dlc_names(source_items)
+        if dlc_name in WORKER_DLC_STATE["deps"]
+    }
+    return merged_payloads, node_stats, node_trace, dlc_deps, log.getvalue()
+
+
+def build_node_groups(node_plans):
+    """Group each normal node with the no_resolve nodes derived from or verified against it."""
+    plans_by_path = {plan["rule_rel_path"]: plan for plan in node_plans}
+    groups = {}
+    for plan in node_plans:
+        base_plan = plans_by_path.get(plan["base_rel_path"], plan)
+        groups.setdefault(base_plan["rule_rel_path"], []).append(plan)
+    return list(groups.values())
+
+
+def get_plan_cache_keys(plan):
+    return {get_payload_cache_key(source_item) for source_item in plan["entry"]["source_items"]}
+
+
+class NodeScheduler:
+    """Process nodes as their downloads arrive instead of after the whole download phase.
+
+    Nodes run in groups: a normal node plus the no_resolve nodes that need its
+    payload. A group starts once every URL it reads has arrived. Texts and
+    parsed payloads are dropped after their last reader finishes. Each node's
+    log is kept in a buffer and printed in plan order at the end, so the output
+    does not depend on download order.
+    """
+
+    def __init__(self, node_plans, previous_manifest, reprocess_names, executor=None):
+        self.node_plans = node_plans
+        self.groups = build_node_groups(node_plans)
+        self.previous_manifest = previous_manifest
+        self.reprocess_names = reprocess_names
+        self.executor = executor
+        self.aggregate_ip = get_ip_aggregate_enabled()
+        self.events = queue.Queue()
+        self.downloaded_texts = {}
+        self.downloaded_count = 0
+        self.download_failures = []
+        self.waiting_groups = {}
+        self.missing_urls = {}
+        self.url_readers = collections.Counter()
+        self.payload_readers = collections.Counter()
+        self.results = {}
+        self.running = 0
+        self.generated_rules = {}
+        self.build_manifest = {}
+        self.stats = {
+            "nodes": 0,
+            "unchanged": 0,
+            "source_payloads": 0,
+            "deduped_payloads": 0,
+            "removed_duplicates": 0,
+            "removed_covered": 0,
+            "removed_ip_covered": 0,
+        }
+        self.verified_nodes = 0
+        self.mismatched_nodes = 0
+        self.dlc_cache = {}
+        self.dlc_repo_dir = get_dlc_repo_dir()
+        self.dlc_state = {"repo_ready": False, "commit": None, "deps": {}}
+        self.payload_cache = {}
+        self.text_hashes = {}
+        self.dlc_file_hashes = {}
+        self.dlc_log = io.StringIO()
+
+        for group in self.groups:
+            group_urls = {url for plan in group for url in plan["urls"]}
+            self.missing_urls[id(group)] = len(group_urls)
+            for url in group_urls:
+                self.waiting_groups.setdefault(url, []).append(group)
+            for plan in group:
+                self.url_readers.update(set(plan["urls"]))
+                self.payload_readers.update(get_plan_cache_keys(plan))
+
+    def on_download(self, url, text, error):
+        self.events.put(("download", url, text, error))
+
+    def on_task_done(self, group, plan, future):
+        self.events.put(("node", group, plan, future))
+
+    def needs_dlc_repo(self):
+        for plan in self.node_plans:
+            if source_items_may_need_dlc(plan["entry"]["source_items"]):
+                return True
+            if (self.previous_manifest.get(plan["rule_rel_path"]) or {}).get("dlc"):
+                return True
+        return False
+
+    def run(self, urls):
+        """Return ``(download summary, download seconds)`` once every node that can run has finished."""
+        started_at = time.perf_counter()
+        download_elapsed = 0.0
+        pending_downloads = len(urls)
+        if self.needs_dlc_repo():
+            # The clone or fetch overlaps the HTTP downloads; the first DLC lookup waits for it.
+            start_dlc_repo_sync(self.dlc_repo_dir, self.dlc_state)
+        finish_downloads = start_text_downloads(urls, self.on_download) if urls else None
+        try:
+            for group in self.groups:
+                if not self.missing_urls[id(group)]:
+                    self.start_group(group)
+            while pending_downloads or self.running:
+                kind, *event = self.events.get()
+                if kind == "download":
+                    pending_downloads -= 1
+                    if not pending_downloads:
+                        download_elapsed = time.perf_counter() - started_at
+                    self.receive_text(*event)
+                else:
+                    group, plan, future = event
+                    self.running -= 1
+                    self.results[id(plan)] = future.result()
+                    self.finish_group_if_ready(group)
+        except BaseException:
+            if finish_downloads is not None:
+                finish_downloads(cancel=True)
+            raise
+        finally:
+            # Never leave a git process behind; a sync nobody needed may fail without failing the run.
+            if "sync" in self.dlc_state:
+                concurrent.futures.wait([self.dlc_state["sync"]])
+
+        summary = finish_downloads() if finish_downloads is not None else None
+        if self.download_failures:
+            raise RuleUpdateError(format_download_failures(self.download_failures))
+        return summary, download_elapsed
+
+    def receive_text(self, url, text, error):
+        if error is not None:
+            self.download_failures.append((url, error))
+            return
+        self.downloaded_count += 1
+        self.downloaded_texts[url] = text
+        for group in self.waiting_groups.pop(url, ()):
+            self.missing_urls[id(group)] -= 1
+            if not self.missing_urls[id(group)]:
+                self.start_group(group)
+
+    def prepare_dlc(self, group):
+        # DLC setup logs once for the whole run, whichever group happens to need it first.
+        with contextlib.redirect_stdout(self.dlc_log):
+            if any(
+                source_items_need_dlc(plan["entry"]["source_items"], self.downloaded_texts) for plan in group
+            ):
+                prepare_dlc_cache(self.dlc_repo_dir, self.dlc_cache, self.dlc_state)
+            elif any((self.previous_manifest.get(plan["rule_rel_path"]) or {}).get("dlc") for plan in group):
+                ensure_dlc_repo_once(self.dlc_repo_dir, self.dlc_state)
+
+    def start_group(self, group):
+        self.prepare_dlc(group)
+        with contextlib.redirect_stdout(group[0]["log"]):
+            for plan in group:
+                plan["text_inputs"] = collect_node_text_inputs(
+                    plan["entry"]["source_items"], self.downloaded_texts, self.text_hashes
+                )
+                previous = self.previous_manifest.get(plan["rule_rel_path"])
+                if Path(plan["rule_rel_path"]).name in self.reprocess_names or not is_node_unchanged(
+                    previous,
+                    plan["config_hash"],
+                    plan["text_inputs"],
+                    RULES_SET_DIR / plan["rule_rel_path"],
+                    self.dlc_repo_dir,
+                    self.dlc_state,
+                    self.dlc_file_hashes,
+                ):
+                    previous = None
+                plan["previous"] = previous
+            # A derived or verified node needs its base payload in memory,
+            # so the group is reprocessed together.
+            if any(plan["previous"] is None for plan in group):
+                for plan in group:
+                    plan["previous"] = None
+
+            for plan in group:
+                if plan["previous"] is None and not plan["derived"]:
+                    self.start_plan(group, plan)
+        self.finish_group_if_ready(group)
+
+    def start_plan(self, group, plan):
+        source_items = plan["entry"]["source_items"]
+        if self.executor is None:
+            with contextlib.redirect_stdout(plan["log"]):
+                merged_payloads, node_stats, node_trace = process_source_node(
+                    source_items,
+                    self.dlc_cache,
+                    self.dlc_repo_dir,
+                    self.dlc_state,
+                    self.downloaded_texts,
+                    self.aggregate_ip,
+                    self.payload_cache,
+                )
+            self.results[id(plan)] = merged_payloads, node_stats, node_trace, {}, ""
+            return
+
+        node_texts = {url: self.downloaded_texts[url] for url in plan["text_inputs"]}
+        future = self.executor.submit(
+            process_source_node_task,
+            source_items,
+            node_texts,
+            self.dlc_repo_dir,
+            self.dlc_state.get("commit"),
+            self.aggregate_ip,
+        )
+        self.running += 1
+        future.add_done_callback(functools.partial(self.on_task_done, group, plan))
+
+    def finish_group_if_ready(self, group):
+        for plan in group:
+            if plan["previous"] is None and not plan["derived"] and id(plan) not in self.results:
+                return
+        for plan in group:
+            with contextlib.redirect_stdout(plan["log"]):
+                self.finish_plan(plan)
+            self.release_inputs(plan)
+
+    def finish_plan(self, plan):
+        entry = plan["entry"]
+        source_items = entry["source_items"]
+        rule_rel_path = plan["rule_rel_path"]
+        if plan["previous"] is not None:
+            if plan["previous"].get("dlc"):
+                plan["previous"]["dlc_commit"] = self.dlc_state["commit"]
+            self.build_manifest[rule_rel_path] = plan["previous"]
+            node_stats = plan["previous"]["stats"]
+            node_trace = None
+            status = "Unchanged"
+            self.stats["unchanged"] += 1
+        else:
+            base_payloads = None
+            if plan["base_rel_path"] is not None:
+                base_payloads = self.generated_rules[plan["base_rel_path"]]["payload"]
+            if plan["derived"]:
+                merged_payloads, node_stats = derive_no_resolve_payload(base_payloads, self.aggregate_ip)
+                node_trace = None
+            else:
+                merged_payloads, node_stats, node_trace, dlc_deps, log = self.results.pop(id(plan))
+                self.dlc_state["deps"].update(dlc_deps)
+                print(log, end="")
+            if base_payloads is not None and not plan["derived"]:
+                derived_payloads, _derived_stats = derive_no_resolve_payload(base_payloads, self.aggregate_ip)
+                self.verified_nodes += 1
+                self.mismatched_nodes += report_no_resolve_diff(
+                    rule_rel_path, derived_payloads, merged_payloads
+                )
+            self.generated_rules[rule_rel_path] = {"payload": merged_payloads}
+            dlc_inputs = collect_node_dlc_inputs(
+                source_items, self.dlc_state, self.dlc_repo_dir, self.dlc_file_hashes
+            )
+            self.build_manifest[rule_rel_path] = {
+                "config": plan["config_hash"],
+                "inputs": plan["text_inputs"],
+                "dlc": dlc_inputs,
+                "dlc_commit": self.dlc_state["commit"] if dlc_inputs else None,
+                "stats": node_stats,
+                "payload_sha256": None,
+            }
+            status = "Derived" if plan["derived"] else "Processed"
+
+        self.stats["nodes"] += 1
+        self.stats["source_payloads"] += node_stats["source"]
+        self.stats["deduped_payloads"] += node_stats["deduped"]
+        self.stats["removed_duplicates"] += node_stats["duplicates"]
+        self.stats["removed_covered"] += node_stats["covered"]
+        self.stats["removed_ip_covered"] += node_stats["ip_covered"]
+        record_node_trace(entry, rule_rel_path, status, node_stats, node_trace)
+        print(
+            f"{status} {entry['file_path']}::{entry['node_name']}: "
+            f"source={node_stats['source']}, deduped={node_stats['deduped']}, "
+            f"duplicates={node_stats['duplicates']}, "
+            f"covered={node_stats['covered']}, ip_covered={node_stats['ip_covered']}"
+        )
+
+    def release_inputs(self, plan):
+        for url in set(plan["urls"]):
+            self.url_readers[url] -= 1
+            if not self.url_readers[url]:
+                self.downloaded_texts.pop(url, None)
+        for cache_key in get_plan_cache_keys(plan):
+            self.payload_readers[cache_key] -= 1
+            if not self.payload_readers[cache_key]:
+                self.payload_cache.pop(cache_key, None)
+
+    def print_logs(self):
+        print(self.dlc_log.getvalue(), end="", flush=True)
+        for plan in self.node_plans:
+            print(plan["log"].getvalue(), end="", flush=True)
+
+
+def record_node_trace(entry, rule_rel_path, status, node_stats, node_trace):
+    node_key = f"{entry['file_path']}::{entry['node_name']}"
+    fields = {"output": rule_rel_path, "status": status, "stats": node_stats}
+    if node_trace is not None:
+        fields.update(
+            seconds=node_trace["duration"],
+            pid=node_trace["pid"],
+            sources=node_trace["sources"],
+            stages=node_trace["stages"],
+        )
+        BUILD_TRACE.add_span(
+            node_key,
+            "node",
+            node_trace["start"],
+            node_trace["duration"],
+            pid=node_trace["pid"],
+            tid=node_trace["pid"],
+        )
+    BUILD_TRACE.record_node(node_key, **fields)
+
+
+def collect_generated_rules(source_dir, previous_manifest=None, reprocess_names=frozenset()):
     started_at = time.perf_counter()
-    source_entries = build_source_plan(source_dir)
+    no_resolve_mode = get_no_resolve_mode()
+    with BUILD_TRACE.span("plan"):
+        source_entries = build_source_plan(source_dir)
+        no_resolve_bases = map_no_resolve_bases(source_entries) if no_resolve_mode != "source" else {}
     plan_elapsed = time.perf_counter() - started_at
-    downloaded_texts, download_elapsed = download_all_texts(collect_download_urls(source_entries))
-    process_started_at = time.perf_counter()
-    generated_rules = {}
     generated_indexes = {}
-    stats = {
-        "nodes": 0,
-        "source_payloads": 0,
-        "deduped_payloads": 0,
-        "removed_duplicates": 0,
-        "removed_covered": 0,
-        "removed_ip_covered": 0,
-    }
-    dlc_cache = {}
-    dlc_state = {"repo_ready": False}
 
-    for entry in source_entries:
-        file_path = entry["file_path"]
-        node_name = entry["node_name"]
-        node_data = entry["node_data"]
-        source_items = entry["source_items"]
+    node_plans = []
+    for position, entry in enumerate(source_entries):
         subpath = entry["subpath"]
-        index_name = entry["index_name"]
-        index_data = generated_indexes.setdefault(index_name, {})
+        node_name = entry["node_name"]
+        index_data = generated_indexes.setdefault(entry["index_name"], {})
+        index_data[node_name] = build_rule_entry(node_name, entry["node_data"], subpath)
+        base_entry = no_resolve_bases.get(position)
+        derived = base_entry is not None and no_resolve_mode == "derive"
+        node_plans.append(
+            {
+                "entry": entry,
+                "rule_rel_path": (
+                    Path(subpath) / f"{node_name}.yaml" if subpath else Path(f"{node_name}.yaml")
+                ).as_posix(),
+                "config_hash": fingerprint_source_node(entry),
+                "urls": [] if derived else collect_download_urls([entry]),
+                "text_inputs": None,
+                "previous": None,
+                "base_rel_path": f"{base_entry['node_name']}.yaml" if base_entry is not None else None,
+                "derived": derived,
+                "log": io.StringIO(),
+            }
+        )
 
-        downloaded_payloads = []
-        for source_item in source_items:
-            downloaded_payloads.extend(
-                download_payload(source_item, dlc_cache, DLC_REPO_DIR, dlc_state, downloaded_texts)
+    process_workers = min(get_process_workers(), sum(not plan["derived"] for plan in node_plans))
+    profile_path = get_profile_path()
+    profiler = cProfile.Profile() if profile_path else None
+    urls = collect_download_urls([plan["entry"] for plan in node_plans if not plan["derived"]])
+    process_started_at = time.perf_counter()
+    process_started_wall = time.time()
+    with contextlib.ExitStack() as exit_stack:
+        if profiler is not None:
+            profiler.enable()
+            exit_stack.callback(profiler.disable)
+        executor = None
+        if process_workers > 1:
+            executor = exit_stack.enter_context(
+                concurrent.futures.ProcessPoolExecutor(max_workers=process_workers)
             )
-
-        exact_deduped_payloads = dedupe_keep_order(downloaded_payloads)
-        cleaned_payloads, removed_covered = remove_covered_domain_rules(exact_deduped_payloads)
-        cleaned_payloads, removed_ip_covered = remove_covered_ip_rules(cleaned_payloads)
-        merged_payloads = sort_rule_payload(cleaned_payloads)
-        rule_rel_path = Path(subpath) / f"{node_name}.yaml" if subpath else Path(f"{node_name}.yaml")
-        generated_rules[rule_rel_path.as_posix()] = {"payload": merged_payloads}
-        index_data[node_name] = build_rule_entry(node_name, node_data, subpath)
-
-        source_count = len(downloaded_payloads)
-        exact_deduped_count = len(exact_deduped_payloads)
-        final_count = len(merged_payloads)
-        stats["nodes"] += 1
-        stats["source_payloads"] += source_count
-        stats["deduped_payloads"] += final_count
-        stats["removed_duplicates"] += source_count - exact_deduped_count
-        stats["removed_covered"] += removed_covered
-        stats["removed_ip_covered"] += removed_ip_covered
+            exit_stack.callback(executor.shutdown, cancel_futures=True)
+        scheduler = NodeScheduler(node_plans, previous_manifest or {}, reprocess_names, executor)
+        try:
+            summary, download_elapsed = scheduler.run(urls)
+        except BaseException:
+            scheduler.print_logs()
+            raise
+
+    BUILD_TRACE.add_span("download", "stage", process_started_wall, download_elapsed)
+    BUILD_TRACE.add_span("process", "stage", process_started_wall, time.time() - process_started_wall)
+    if urls:
         print(
-            f"Processed {file_path}::{node_name}: "
-            f"source={source_count}, deduped={final_count}, "
-            f"duplicates={source_count - exact_deduped_count}, "
-            f"covered={removed_covered}, ip_covered={removed_ip_covered}",
+            f"Downloaded {scheduler.downloaded_count} unique URL(s) {summary} in {download_elapsed:.2f}s "
+            f"(cache: hit={HTTP_CACHE_STATS['hit']}, revalidated={HTTP_CACHE_STATS['revalidated']}, "
+            f"miss={HTTP_CACHE_STATS['miss']})",
             flush=True,
         )
-
+    scheduler.print_logs()
+    if no_resolve_mode == "verify":
+        print(
+            f"Verified derived no-resolve rules: nodes={scheduler.verified_nodes}, "
+            f"mismatched={scheduler.mismatched_nodes}",
+            flush=True,
+        )
+    if profiler is not None:
+        profile_path.parent.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(profile_path)
+        print(f"Wrote process phase profile to {profile_path}", flush=True)
+
+    # Nodes finish in download order; keep the published order stable.
+    generated_rules = {
+        plan["rule_rel_path"]: scheduler.generated_rules[plan["rule_rel_path"]]
+        for plan in node_plans
+        if plan["rule_rel_path"] in scheduler.generated_rules
+    }
+    stats = scheduler.stats
     stats["timings"] = {
         "plan": plan_elapsed,
         "download": download_elapsed,
         "process": time.perf_counter() - process_started_at,
     }
-    return generated_rules, generated_indexes, stats
+    return generated_rules, generated_indexes, stats, scheduler.build_manifest
 
 
 def existing_auto_rule_paths():
@@ -773,61 +2386,193 @@ def existing_auto_rule_paths():
     return paths
 
 
-def replace_file(source_path, target_path):
-    target_path.parent.mkdir(parents=True, exist_ok=True)
-    temp_path = target_path.with_name(f".{target_path.name}.tmp")
-    shutil.copy2(source_path, temp_path)
-    temp_path.replace(target_path)
+def apply_proxy_weighting(generated_rules, build_manifest):
+    stale_paths = existing_auto_rule_paths() - set(build_manifest)
+    rules_payloads = {}
+    for rel_path in sorted(generated_rules):
+        rel_dir = Path(rel_path).parent
+        if Path(rel_path).name not in PROXY_FILENAMES or rel_dir in rules_payloads:
+            continue
+        rules_dir = RULES_SET_DIR / rel_dir
+        file_names = {file_path.name for file_path in rules_dir.glob("*.yaml") if file_path.is_file()}
+        file_names.update(Path(path).name for path in generated_rules if Path(path).parent == rel_dir)
+
+        payloads = {}
+        for file_name in sorted(file_names):
+            file_rel_path = (rel_dir / file_name).as_posix()
+            if file_rel_path in generated_rules:
+                payloads[file_name] = generated_rules[file_rel_path]["payload"]
+            elif file_rel_path not in stale_paths:
+                payloads[file_name] = load_payload_file(rules_dir / file_name)
+        rules_payloads[rel_dir] = payloads
+
+    updates = build_proxy_updates(rules_payloads, get_weighting_mode(), get_weighting_workers())
+    for update in updates:
+        rel_path = update["file"].as_posix()
+        generated_rules[rel_path] = {"payload": update["payload"]}
+        removed_by_kind = update["removed_by_kind"]
+        print(
+            f"Weighted {RULES_SET_DIR / rel_path}: "
+            f"original={update['original']}, filtered={update['filtered']}, removed={update['removed']} "
+            f"(exact={removed_by_kind['exact']}, suffix={removed_by_kind['suffix']}, "
+            f"cidr={removed_by_kind['cidr']})",
+            flush=True,
+        )
+    return updates
 
 
-def write_tmp_output(tmp_dir, generated_rules, generated_indexes):
-    if tmp_dir.exists():
-        shutil.rmtree(tmp_dir)
-    tmp_rules_set_dir = tmp_dir / "rules_set"
+def stage_mrs_file(target_path, behavior, payload):
+    target_path.parent.mkdir(parents=True, exist_ok=True)
+    source_path = target_path.with_name(f".{target_path.stem}.source.yaml")
+    temp_path = get_temp_path(target_path)
+    source_path.write_text(render_payload(payload), encoding="utf-8")
+    try:
+        run_command([get_mihomo_bin(), "convert-ruleset", behavior, "yaml", str(source_path), str(temp_path)])
+    finally:
+        source_path.unlink(missing_ok=True)
+    if hash_file(temp_path) == hash_file(target_path):
+        temp_path.unlink()
+        return None
+    return temp_path
+
 
-    for rel_path, data in generated_rules.items():
-        write_yaml_file(tmp_rules_set_dir / rel_path, data)
-    for index_name, data in generated_indexes.items():
-        write_yaml_file(tmp_dir / index_name, data)
+def stage_mrs_outputs(generated_binaries):
+    if not generated_binaries:
+        return []
+    workers = min(os.cpu_count() or 1, len(generated_binaries))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            (
+                executor.submit(stage_mrs_file, RULES_SET_DIR / rel_path, data["behavior"], data["payload"]),
+                rel_path,
+            )
+            for rel_path, data in generated_binaries.items()
+        ]
+        return [(future.result(), RULES_SET_DIR / rel_path) for future, rel_path in futures]
 
 
-def publish_output(tmp_dir, generated_rules, generated_indexes):
+def write_output(generated_rules, generated_indexes, unchanged_paths=frozenset(), generated_binaries=None):
+    generated_binaries = generated_binaries or {}
     RULES_DIR.mkdir(parents=True, exist_ok=True)
     RULES_SET_DIR.mkdir(parents=True, exist_ok=True)
+    stale_paths = (
+        existing_auto_rule_paths() - set(generated_rules) - set(generated_binaries) - set(unchanged_paths)
+    )
+
+    output_hashes = {}
+    outputs = []
+    for rel_path, data in generated_rules.items():
+        text = render_payload(data["payload"])
+        output_hashes[rel_path] = hash_text(text)
+        outputs.append((RULES_SET_DIR / rel_path, text, output_hashes[rel_path]))
+    for index_name, data in generated_indexes.items():
+        outputs.append((RULES_DIR / index_name, yaml_dump(data), None))
+
+    staged_files = []
+    publish_result = {
+        "changed": [],
+        "unchanged": [RULES_SET_DIR / rel_path for rel_path in unchanged_paths],
+        "deleted": [],
+    }
+    for target_path, text, text_hash in outputs:
+        temp_path = stage_text_file(target_path, text, text_hash)
+        if temp_path is None:
+            publish_result["unchanged"].append(target_path)
+        else:
+            staged_files.append((temp_path, target_path))
+    for temp_path, target_path in stage_mrs_outputs(generated_binaries):
+        if temp_path is None:
+            publish_result["unchanged"].append(target_path)
+        else:
+            staged_files.append((temp_path, target_path))
 
-    auto_paths = existing_auto_rule_paths()
-    auto_paths.update(generated_rules.keys())
+    for temp_path, target_path in staged_files:
+        temp_path.replace(target_path)
+        publish_result["changed"].append(target_path)
 
-    for rel_path in sorted(auto_paths):
+    for rel_path in sorted(stale_paths):
         target_path = RULES_SET_DIR / rel_path
-        source_path = tmp_dir / "rules_set" / rel_path
-        if source_path.exists():
-            replace_file(source_path, target_path)
-        elif target_path.exists():
+        if target_path.exists():
             target_path.unlink()
+            publish_result["deleted"].append(target_path)
+    return output_hashes, publish_result
+
 
-    for index_name in sorted(generated_indexes):
-        replace_file(tmp_dir / index_name, RULES_DIR / index_name)
+def remove_staged_output(generated_rules, generated_indexes, generated_binaries=None):
+    target_paths = [RULES_SET_DIR / rel_path for rel_path in [*generated_rules, *(generated_binaries or ())]]
+    target_paths.extend(RULES_DIR / index_name for index_name in generated_indexes)
+    for target_path in target_paths:
+        get_temp_path(target_path).unlink(missing_ok=True)
 
 
 def main():
+    generated_rules = {}
+    generated_indexes = {}
+    generated_binaries = {}
+    build_trace = reset_build_trace()
+    trace_path = get_trace_path()
+    trace_format = "json"
     try:
         started_at = time.perf_counter()
-        generated_rules, generated_indexes, stats = collect_generated_rules(SOURCE_DIR)
+        trace_format = get_trace_format()
+        weighting_enabled = get_weighting_enabled()
+        mrs_enabled = get_mrs_enabled()
+        split_enabled = get_split_behavior_enabled()
+        previous_manifest = load_build_manifest(BUILD_MANIFEST_PATH)
+        if weighting_enabled and split_enabled:
+            # Split outputs no longer hold the classical payload weighting compares against.
+            print(
+                "Incremental build disabled: RULE_WEIGHTING with RULE_SPLIT_BEHAVIOR reprocesses every node",
+                flush=True,
+            )
+            previous_manifest = {}
+        generated_rules, generated_indexes, stats, build_manifest = collect_generated_rules(
+            SOURCE_DIR,
+            previous_manifest,
+            reprocess_names=frozenset(PROXY_FILENAMES) if weighting_enabled else frozenset(),
+        )
+        unchanged_nodes = set(build_manifest) - set(generated_rules)
+        if weighting_enabled:
+            try:
+                with build_trace.span("weighting"):
+                    apply_proxy_weighting(generated_rules, build_manifest)
+            except RuleWeightingError as exc:
+                raise RuleUpdateError(str(exc)) from exc
+        if mrs_enabled or split_enabled:
+            generated_binaries = add_derived_outputs(
+                generated_rules, generated_indexes, build_manifest, mrs_enabled, split_enabled
+            )
         write_started_at = time.perf_counter()
-        write_tmp_output(TMP_OUTPUT_DIR, generated_rules, generated_indexes)
-        publish_output(TMP_OUTPUT_DIR, generated_rules, generated_indexes)
+        with build_trace.span("write"):
+            unchanged_paths = set()
+            for rel_path in unchanged_nodes:
+                if build_manifest[rel_path].get("classical") is not False:
+                    unchanged_paths.add(rel_path)
+                unchanged_paths.update(
+                    extra["path"] for extra in build_manifest[rel_path].get("extra_outputs", ())
+                )
+            output_hashes, publish_result = write_output(
+                generated_rules, generated_indexes, unchanged_paths, generated_binaries
+            )
+            write_publish_report(PUBLISH_REPORT_PATH, **publish_result)
+            for rel_path, payload_hash in output_hashes.items():
+                if rel_path in build_manifest:
+                    build_manifest[rel_path]["payload_sha256"] = payload_hash
+            save_build_manifest(BUILD_MANIFEST_PATH, build_manifest)
         write_elapsed = time.perf_counter() - write_started_at
         total_elapsed = time.perf_counter() - started_at
         timings = stats.get("timings", {})
         print(
             "Rule update complete: "
-            f"nodes={stats['nodes']}, files={len(generated_rules)}, "
+            f"nodes={stats['nodes']}, files={len(generated_rules)}, unchanged={stats['unchanged']}, "
             f"source_payloads={stats['source_payloads']}, "
             f"deduped_payloads={stats['deduped_payloads']}, "
             f"removed_duplicates={stats['removed_duplicates']}, "
             f"removed_covered={stats['removed_covered']}, "
             f"removed_ip_covered={stats['removed_ip_covered']}, "
+            f"published=changed:{len(publish_result['changed'])}/"
+            f"unchanged:{len(publish_result['unchanged'])}/"
+            f"deleted:{len(publish_result['deleted'])}, "
             f"timings=plan:{timings.get('plan', 0):.2f}s/"
             f"download:{timings.get('download', 0):.2f}s/"
             f"process:{timings.get('process', 0):.2f}s/"
@@ -839,8 +2584,10 @@ def main():
         print(f"Rule update failed: {exc}", file=sys.stderr)
         return 1
     finally:
-        if TMP_OUTPUT_DIR.exists():
-            shutil.rmtree(TMP_OUTPUT_DIR)
+        remove_staged_output(generated_rules, generated_indexes, generated_binaries)
+        if trace_path is not None:
+            build_trace.write(trace_path, trace_format)
+            print(f"Wrote build trace to {trace_path}", flush=True)
     return 0
 
 
@@ -1,128 +1,27 @@
-import os
 import sys
 import time
 from pathlib import Path
 
-import yaml
-
-try:
-    from yaml import CSafeDumper as SafeDumper
-    from yaml import CSafeLoader as SafeLoader
-except ImportError:
-    from yaml import SafeDumper, SafeLoader
+from payload_io import render_payload, stage_text_file, write_publish_report
+from proxy_weighting import (
+    RuleWeightingError,
+    build_proxy_updates,
+    get_weighting_mode,
+    get_weighting_workers,
+    load_rules_payloads,
+)
 
 
 RULES_SET_DIR = Path("./rules/rules_set")
-PROXY_FILENAMES = ("proxy.yaml",)
-
-
-class RuleWeightingError(Exception):
-    """Raised when proxy rule weighting cannot complete safely."""
-
-
-def yaml_load(stream):
-    return yaml.load(stream, Loader=SafeLoader)
-
-
-def yaml_dump(data, stream):
-    yaml.dump(data, stream, Dumper=SafeDumper, allow_unicode=True, sort_keys=False, default_flow_style=False)
+PUBLISH_REPORT_PATH = Path("./.cache/weighting_report.json")
 
 
-def load_yaml_file(file_path):
-    with file_path.open("r", encoding="utf-8") as f:
-        try:
-            data = yaml_load(f)
-        except yaml.YAMLError as exc:
-            raise RuleWeightingError(f"Invalid YAML in {file_path}: {exc}") from exc
-    return data
-
-
-def write_yaml_file(file_path, data):
-    temp_path = file_path.with_name(f".{file_path.name}.tmp")
-    with temp_path.open("w", encoding="utf-8") as f:
-        yaml_dump(data, f)
+def write_payload_file(file_path, payload):
+    temp_path = stage_text_file(file_path, render_payload(payload))
+    if temp_path is None:
+        return False
     temp_path.replace(file_path)
-
-
-def load_payload_file_fast(file_path):
-    payload = []
-    payload_started = False
-
-    with file_path.open("r", encoding="utf-8") as f:
-        for raw_line in f:
-            stripped = raw_line.strip()
-            if not stripped or stripped.startswith("#"):
-                continue
-            if not payload_started:
-                if stripped == "payload:":
-                    payload_started = True
-                    continue
-                return None
-            if not stripped.startswith("- "):
-                return None
-
-            value = stripped[2:].strip()
-            if not value:
-                return None
-            if value[0] in {"'", '"'} or "#" in value or value in {"[]", "{}"}:
-                return None
-            payload.append(value)
-
-    if not payload_started:
-        return None
-    return payload
-
-
-def load_payload_file(file_path):
-    fast_payload = load_payload_file_fast(file_path)
-    if fast_payload is not None:
-        return fast_payload
-
-    data = load_yaml_file(file_path)
-    if not isinstance(data, dict):
-        raise RuleWeightingError(f"Rule file is not a mapping: {file_path}")
-    payload = data.get("payload")
-    if payload is None:
-        raise RuleWeightingError(f"Rule file has no payload node: {file_path}")
-    if not isinstance(payload, list):
-        raise RuleWeightingError(f"Rule file payload is not a list: {file_path}")
-    return payload
-
-
-def collect_excluded_payloads(rules_dir, proxy_file):
-    excluded = set()
-    for filename in sorted(os.listdir(rules_dir)):
-        file_path = rules_dir / filename
-        if file_path == proxy_file or not file_path.is_file() or file_path.suffix != ".yaml":
-            continue
-        for payload in load_payload_file(file_path):
-            excluded.add(payload)
-    return excluded
-
-
-def build_proxy_update(rules_dir, proxy_name):
-    proxy_file = rules_dir / proxy_name
-    if not proxy_file.exists():
-        return None
-
-    proxy_payloads = load_payload_file(proxy_file)
-    excluded_payloads = collect_excluded_payloads(rules_dir, proxy_file)
-    filtered_payloads = [payload for payload in proxy_payloads if payload not in excluded_payloads]
-
-    removed_count = len(proxy_payloads) - len(filtered_payloads)
-    return {
-        "file": proxy_file,
-        "payload": filtered_payloads,
-        "original": len(proxy_payloads),
-        "filtered": len(filtered_payloads),
-        "removed": removed_count,
-    }
-
-
-def iter_rules_dirs(rules_set_dir):
-    for dirpath, dirnames, _ in os.walk(rules_set_dir):
-        dirnames.sort()
-        yield Path(dirpath)
+    return True
 
 
 def main():
@@ -131,13 +30,9 @@ def main():
         print(f"Rule weighting failed: directory does not exist: {RULES_SET_DIR}", file=sys.stderr)
         return 1
 
-    updates = []
     try:
-        for rules_dir in iter_rules_dirs(RULES_SET_DIR):
-            for proxy_name in PROXY_FILENAMES:
-                update = build_proxy_update(rules_dir, proxy_name)
-                if update:
-                    updates.append(update)
+        rules_payloads = load_rules_payloads(RULES_SET_DIR)
+        updates = build_proxy_updates(rules_payloads, get_weighting_mode(), get_weighting_workers())
     except RuleWeightingError as exc:
         print(f"Rule weighting failed: {exc}", file=sys.stderr)
         return 1
@@ -146,13 +41,22 @@ def main():
         print("Rule weighting complete: no proxy.yaml files found")
         return 0
 
+    changed = []
+    unchanged = []
     for update in updates:
-        write_yaml_file(update["file"], {"payload": update["payload"]})
+        if write_payload_file(update["file"], update["payload"]):
+            changed.append(update["file"])
+        else:
+            unchanged.append(update["file"])
+    write_publish_report(PUBLISH_REPORT_PATH, changed, unchanged, [])
 
     for result in updates:
         print(
             f"Weighted {result['file']}: "
-            f"original={result['original']}, filtered={result['filtered']}, removed={result['removed']}"
+            f"original={result['original']}, filtered={result['filtered']}, removed={result['removed']} "
+            f"(exact={result['removed_by_kind']['exact']}, suffix={result['removed_by_kind']['suffix']}, "
+            f"cidr={result['removed_by_kind']['cidr']}), "
+            f"changed={'yes' if result['file'] in changed else 'no'}"
         )
     print(f"Rule weighting complete in {time.perf_counter() - started_at:.2f}s")
     return 0
@@ -0,0 +1,384 @@
+import argparse
+import contextlib
+import gc
+import importlib.util
+import io
+import ipaddress
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import yaml
+
+from payload_io import render_payload, scan_payload_lines
+from proxy_weighting import build_proxy_update
+
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+MERGE_SCRIPT = SCRIPT_DIR / "01.merge_rules.py"
+DEFAULT_BASELINE_PATH = Path("./.cache/benchmark_baseline.json")
+DEFAULT_SCALES = ("10k", "100k")
+DEFAULT_REPEAT = 3
+DEFAULT_REGRESSION_THRESHOLD = 0.25
+DEFAULT_SEED = 20240601
+SCALE_SUFFIXES = {"k": 1_000, "m": 1_000_000}
+TLDS = ("com", "net", "org", "io", "cn", "co.uk", "com.cn", "dev", "app", "jp")
+SYLLABLES = (
+    "ap", "bo", "cloud", "da", "edge", "fi", "go", "hu", "img", "ji", "ka", "lo", "me", "no", "ox", "pi"
+)
+DOMAIN_DEPTH_WEIGHTS = {1: 30, 2: 35, 3: 20, 4: 10, 5: 5}
+DLC_FILE_COUNT = 200
+DLC_INCLUDE_DEPTH = 24
+PIPELINE_NODE_COUNT = 8
+PIPELINE_SOURCE_COUNT = 16
+
+
+def load_merge_module():
+    spec = importlib.util.spec_from_file_location("merge_rules", MERGE_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["merge_rules"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def parse_scale(raw_value):
+    value = raw_value.strip().lower()
+    multiplier = SCALE_SUFFIXES.get(value[-1:], 1)
+    if value[-1:] in SCALE_SUFFIXES:
+        value = value[:-1]
+    try:
+        scale = int(float(value) * multiplier)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(f"invalid scale: {raw_value!r}") from exc
+    if scale <= 0:
+        raise argparse.ArgumentTypeError(f"scale must be positive: {raw_value!r}")
+    return scale
+
+
+def format_scale(scale):
+    if scale % 1_000_000 == 0:
+        return f"{scale // 1_000_000}m"
+    if scale % 1_000 == 0:
+        return f"{scale // 1_000}k"
+    return str(scale)
+
+
+def random_label(rng):
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 3))) + str(rng.randint(0, 99))
+
+
+def random_domain(rng, depth=None):
+    if depth is None:
+        depth = rng.choices(tuple(DOMAIN_DEPTH_WEIGHTS), weights=tuple(DOMAIN_DEPTH_WEIGHTS.values()))[0]
+    return ".".join([*(random_label(rng) for _ in range(depth)), rng.choice(TLDS)])
+
+
+def random_network(rng, version):
+    if version == 4:
+        prefixlen = rng.choice((8, 12, 16, 20, 22, 24, 24, 24, 28, 32))
+        address = rng.getrandbits(32)
+    else:
+        prefixlen = rng.choice((24, 32, 32, 40, 48, 48, 56, 64, 128))
+        address = (0x2 << 124) | rng.getrandbits(124)
+    return ipaddress.ip_network((address, prefixlen), strict=False)
+
+
+def random_subnet(rng, parent):
+    prefixlen = min(parent.prefixlen + rng.randint(1, 8), parent.max_prefixlen)
+    offset = rng.getrandbits(prefixlen - parent.prefixlen) if prefixlen > parent.prefixlen else 0
+    address = int(parent.network_address) + (offset << (parent.max_prefixlen - prefixlen))
+    return ipaddress.ip_network((address, prefixlen))
+
+
+def generate_payload(rng, count, ipv6_ratio=0.25):
+    """Build ``count`` Clash rules with nested suffixes, nested CIDRs and duplicates."""
+    payload = []
+    suffixes = []
+    networks = []
+    while len(payload) < count:
+        roll = rng.random()
+        if roll < 0.30:
+            suffix = random_domain(rng)
+            suffixes.append(suffix)
+            payload.append(f"DOMAIN-SUFFIX,{suffix}")
+        elif roll < 0.55:
+            if suffixes and rng.random() < 0.3:
+                domain = f"{random_label(rng)}.{rng.choice(suffixes)}"
+            else:
+                domain = random_domain(rng)
+            payload.append(f"DOMAIN,{domain.upper() if rng.random() < 0.02 else domain}")
+        elif roll < 0.60:
+            payload.append(f"DOMAIN-KEYWORD,{random_label(rng)}")
+        elif roll < 0.90:
+            version = 6 if rng.random() < ipv6_ratio else 4
+            if networks and rng.random() < 0.2:
+                network = random_subnet(rng, rng.choice(networks))
+            else:
+                network = random_network(rng, version)
+                networks.append(network)
+            rule_type = "IP-CIDR" if network.version == 4 else "IP-CIDR6"
+            payload.append(f"{rule_type},{network}")
+        elif roll < 0.95 and payload:
+            payload.append(rng.choice(payload))
+        else:
+            payload.append(f"PROCESS-NAME,{random_label(rng)}.exe")
+    return payload
+
+
+def write_dlc_tree(rng, repo_dir, rules_per_file):
+    """Write a synthetic domain-list-community ``data`` directory with long include chains."""
+    data_dir = repo_dir / "data"
+    data_dir.mkdir(parents=True, exist_ok=True)
+    names = [f"site{index:04d}" for index in range(DLC_FILE_COUNT)]
+    for index, name in enumerate(names):
+        lines = [f"# synthetic {name}"]
+        for _ in range(rules_per_file):
+            roll = rng.random()
+            domain = random_domain(rng)
+            if roll < 0.70:
+                lines.append(domain + (" @ads" if rng.random() < 0.1 else ""))
+            elif roll < 0.90:
+                lines.append(f"full:{domain}")
+            elif roll < 0.97:
+                lines.append(f"keyword:{random_label(rng)}")
+            else:
+                lines.append(f"regexp:^{random_label(rng)}\\d+\\.{rng.choice(TLDS)}$")
+        if index % DLC_INCLUDE_DEPTH != DLC_INCLUDE_DEPTH - 1 and index + 1 < len(names):
+            lines.append(f"include:{names[index + 1]}")
+        if index + DLC_INCLUDE_DEPTH < len(names) and rng.random() < 0.3:
+            lines.append(f"include:{names[index + DLC_INCLUDE_DEPTH]} @-ads")
+        (data_dir / name).write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return names
+
+
+def measure(func, repeat, track_memory):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        gc.collect()
+        started_at = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started_at)
+
+    peak_memory = None
+    if track_memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            func()
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return min(timings), peak_memory, result
+
+
+@contextlib.contextmanager
+def working_directory(path):
+    previous = Path.cwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def build_pipeline_workspace(rng, workspace, scale):
+    source_dir = workspace / "source"
+    source_dir.mkdir(parents=True)
+    rules_per_source = max(1, scale // PIPELINE_SOURCE_COUNT)
+    texts = {}
+    for index in range(PIPELINE_SOURCE_COUNT):
+        url = f"https://raw.githubusercontent.com/benchmark/rules/master/source{index:02d}.yaml"
+        texts[url] = render_payload(generate_payload(rng, rules_per_source))
+
+    urls = sorted(texts)
+    source_data = {}
+    for index in range(PIPELINE_NODE_COUNT):
+        node_name = "proxy" if index == 0 else f"node{index:02d}"
+        source_data[node_name] = {
+            "type": "http",
+            "behavior": "classical",
+            "urls": rng.sample(urls, k=max(1, len(urls) // 3)),
+        }
+    with (source_dir / "bench.yaml").open("w", encoding="utf-8") as f:
+        yaml.safe_dump(source_data, f, sort_keys=False)
+    return texts
+
+
+def run_pipeline(merge, workspace, texts):
+    def start_text_downloads(urls, on_done):
+        for url in urls:
+            on_done(url, texts[url], None)
+        return lambda cancel=False: "from memory"
+
+    original_download = merge.start_text_downloads
+    merge.start_text_downloads = start_text_downloads
+    try:
+        with working_directory(workspace), contextlib.redirect_stdout(io.StringIO()):
+            return merge.collect_generated_rules(merge.SOURCE_DIR)
+    finally:
+        merge.start_text_downloads = original_download
+
+
+def run_benchmarks(scale, repeat, track_memory, seed):
+    merge = load_merge_module()
+    rng = random.Random(seed + scale)
+    payload = generate_payload(rng, scale)
+    stages = {}
+
+    def record(stage_name, func, items):
+        elapsed, peak_memory, result = measure(func, repeat, track_memory)
+        stages[stage_name] = {
+            "items": items,
+            "seconds": elapsed,
+            "items_per_second": items / elapsed if elapsed else None,
+            "peak_bytes": peak_memory,
+        }
+        return result
+
+    records = record("parse", lambda: merge.parse_rule_records(merge.dedupe_keep_order(payload)), len(payload))
+    domain_records, _removed = record(
+        "domain_cover", lambda: merge.remove_covered_domain_rules(records), len(records)
+    )
+    ip_records, _removed = record(
+        "ip_cover", lambda: merge.remove_covered_ip_rules(domain_records), len(domain_records)
+    )
+    record(
+        "ip_aggregate",
+        lambda: merge.remove_covered_ip_rules(domain_records, aggregate=True),
+        len(domain_records),
+    )
+    sorted_payload = record("sort", lambda: merge.sort_rule_payload(ip_records), len(ip_records))
+    text = record("render", lambda: render_payload(sorted_payload), len(sorted_payload))
+    record("scan", lambda: scan_payload_lines(text.splitlines()), len(sorted_payload))
+
+    proxy_payload = generate_payload(random.Random(seed - scale), max(1, scale // 4))
+    sibling_payloads = {"proxy.yaml": proxy_payload, "other.yaml": payload}
+    for mode in ("exact", "semantic"):
+        record(
+            f"weighting_{mode}",
+            lambda mode=mode: build_proxy_update(Path("."), "proxy.yaml", sibling_payloads, mode),
+            len(proxy_payload) + len(payload),
+        )
+
+    with tempfile.TemporaryDirectory(prefix="rule-benchmark-") as temp_dir:
+        workspace = Path(temp_dir)
+        dlc_dir = workspace / "dlc"
+        rules_per_file = max(1, scale // DLC_FILE_COUNT)
+        names = write_dlc_tree(rng, dlc_dir, rules_per_file)
+
+        def resolve_all():
+            dlc_cache = {}
+            for name in names:
+                merge.resolve_dlc_rules(name, dlc_cache, dlc_dir)
+            return dlc_cache
+
+        record("dlc_resolve", resolve_all, rules_per_file * len(names))
+
+        pipeline_dir = workspace / "pipeline"
+        texts = build_pipeline_workspace(rng, pipeline_dir, scale)
+        record("pipeline", lambda: run_pipeline(merge, pipeline_dir, texts), scale)
+    return stages
+
+
+def compare_with_baseline(results, baseline, threshold):
+    regressions = []
+    for scale_name, stages in results.items():
+        for stage_name, stage in stages.items():
+            previous = baseline.get(scale_name, {}).get(stage_name)
+            if not previous or not previous.get("seconds"):
+                continue
+            ratio = stage["seconds"] / previous["seconds"]
+            stage["baseline_ratio"] = ratio
+            if ratio > 1 + threshold:
+                regressions.append((scale_name, stage_name, ratio))
+    return regressions
+
+
+def format_bytes(value):
+    if value is None:
+        return "-"
+    return f"{value / (1024 * 1024):.1f}MiB"
+
+
+def print_results(results):
+    for scale_name, stages in results.items():
+        print(f"Benchmark scale={scale_name}", flush=True)
+        for stage_name, stage in stages.items():
+            throughput = stage["items_per_second"]
+            ratio = stage.get("baseline_ratio")
+            print(
+                f"  {stage_name:<18} items={stage['items']:>9} "
+                f"time={stage['seconds']:.4f}s "
+                f"rate={throughput or 0:,.0f}/s "
+                f"peak={format_bytes(stage['peak_bytes'])}"
+                + (f" baseline={ratio:.2f}x" if ratio is not None else ""),
+                flush=True,
+            )
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the rule merge and weighting stages on synthetic data."
+    )
+    parser.add_argument(
+        "--scale",
+        action="append",
+        type=parse_scale,
+        help="number of synthetic rules, e.g. 10k, 1m; may be repeated (default: 10k and 100k)",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=DEFAULT_REPEAT, help="timed runs per stage; the fastest is kept"
+    )
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc peak memory run")
+    parser.add_argument("--output", type=Path, help="write the results as JSON to this path")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_REGRESSION_THRESHOLD)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    scales = args.scale or [parse_scale(value) for value in DEFAULT_SCALES]
+    if args.repeat < 1:
+        print("Benchmark failed: --repeat must be at least 1", file=sys.stderr)
+        return 1
+
+    results = {}
+    for scale in scales:
+        results[format_scale(scale)] = run_benchmarks(scale, args.repeat, not args.no_memory, args.seed)
+
+    regressions = []
+    if args.baseline.exists() and not args.save_baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        regressions = compare_with_baseline(results, baseline.get("results", {}), args.threshold)
+    print_results(results)
+
+    report = {"python": sys.version.split()[0], "seed": args.seed, "repeat": args.repeat, "results": results}
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    if args.save_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"Saved benchmark baseline to {args.baseline}", flush=True)
+
+    if regressions:
+        for scale_name, stage_name, ratio in regressions:
+            print(
+                f"Regression: scale={scale_name} stage={stage_name} is {ratio:.2f}x the baseline",
+                file=sys.stderr,
+            )
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
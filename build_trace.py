@@ -0,0 +1,84 @@
+import contextlib
+import json
+import os
+import threading
+import time
+
+
+SUPPORTED_TRACE_FORMATS = {"json", "chrome"}
+
+
+class BuildTrace:
+    """Timed spans plus per-URL and per-node records for one build.
+
+    Span times are wall-clock seconds so spans recorded in worker processes can
+    be merged with the main process timeline.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.spans = []
+        self.urls = {}
+        self.nodes = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def span(self, name, category="stage", **args):
+        started_at = time.time()
+        try:
+            yield
+        finally:
+            self.add_span(name, category, started_at, time.time() - started_at, **args)
+
+    def add_span(self, name, category, started_at, duration, pid=None, tid=None, **args):
+        span = {
+            "name": name,
+            "category": category,
+            "start": started_at,
+            "duration": duration,
+            "pid": pid or os.getpid(),
+            "tid": tid or threading.get_ident(),
+            "args": args,
+        }
+        with self._lock:
+            self.spans.append(span)
+
+    def record_url(self, url, **fields):
+        with self._lock:
+            self.urls.setdefault(url, {}).update(fields)
+
+    def record_node(self, node_key, **fields):
+        with self._lock:
+            self.nodes.setdefault(node_key, {}).update(fields)
+
+    def to_json(self):
+        return {
+            "started_at": self.started_at,
+            "urls": self.urls,
+            "nodes": self.nodes,
+            "spans": sorted(self.spans, key=lambda span: span["start"]),
+        }
+
+    def to_chrome_trace(self):
+        events = []
+        for span in sorted(self.spans, key=lambda span: span["start"]):
+            events.append(
+                {
+                    "name": span["name"],
+                    "cat": span["category"],
+                    "ph": "X",
+                    "ts": round((span["start"] - self.started_at) * 1_000_000),
+                    "dur": round(span["duration"] * 1_000_000),
+                    "pid": span["pid"],
+                    "tid": span["tid"],
+                    "args": span["args"],
+                }
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write(self, path, trace_format="json"):
+        data = self.to_chrome_trace() if trace_format == "chrome" else self.to_json()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f".{path.name}.tmp")
+        temp_path.write_text(json.dumps(data, ensure_ascii=False, indent=2, default=str), encoding="utf-8")
+        temp_path.replace(path)
@@ -0,0 +1,188 @@
+import hashlib
+import json
+import mmap
+
+import yaml
+
+try:
+    from yaml import CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeDumper
+
+
+PLAIN_SPACED_MAX_LENGTH = 70
+YAML_RESERVED_WORDS = {"yes", "no", "true", "false", "on", "off", "null"}
+
+
+def is_plain_payload_item(item):
+    if not isinstance(item, str) or not item:
+        return False
+    if not (item[0].isascii() and item[0].isalpha()):
+        return False
+    if item[-1] in {" ", ":"} or ": " in item or " #" in item:
+        return False
+    if " " in item and len(item) > PLAIN_SPACED_MAX_LENGTH:
+        return False
+    if not item.isprintable() or "\t" in item:
+        return False
+    return item.lower() not in YAML_RESERVED_WORDS
+
+
+def scan_quoted_item(value):
+    quote = value[0]
+    end = 1
+    while True:
+        end = value.find(quote, end)
+        if end == -1:
+            return None
+        if quote == "'" and value[end + 1:end + 2] == "'":
+            end += 2
+            continue
+        break
+    rest = value[end + 1:].rstrip()
+    if rest and not (rest.startswith(" ") and rest.lstrip(" ").startswith("#")):
+        return None
+    item = value[1:end]
+    if quote == '"' and "\\" in item:
+        return None
+    if quote == "'":
+        item = item.replace("''", "'")
+    return item if item.isprintable() else None
+
+
+def scan_plain_item(value):
+    item = value.partition(" #")[0].rstrip()
+    if not item or not (item[0].isascii() and item[0].isalpha()) or not item.isprintable():
+        return None
+    if item.endswith(":") or ": " in item or item.lower() in YAML_RESERVED_WORDS:
+        return None
+    return item
+
+
+def scan_payload_lines(lines):
+    """Read a flat ``payload:`` list line by line without a YAML parser.
+
+    Handles comments, blank lines and single- or double-quoted items. Returns
+    None for anything else (flow lists, multi-line scalars, escapes, extra
+    keys) so the caller can fall back to PyYAML.
+    """
+    payload = []
+    payload_started = False
+    item_indent = None
+    for index, raw_line in enumerate(lines):
+        if index == 0:
+            raw_line = raw_line.lstrip("\ufeff")
+        if "\t" in raw_line:
+            return None
+        stripped = raw_line.strip()
+        if not stripped or stripped.startswith("#"):
+            continue
+        if not payload_started:
+            if raw_line[0].isspace() or stripped.partition(" #")[0].rstrip() != "payload:":
+                return None
+            payload_started = True
+            continue
+        if stripped == "-" or not stripped.startswith("- "):
+            return None
+        indent = len(raw_line) - len(raw_line.lstrip(" "))
+        if item_indent is None:
+            item_indent = indent
+        elif indent != item_indent:
+            return None
+
+        value = stripped[2:].lstrip()
+        if value[0] in {"'", '"'}:
+            item = scan_quoted_item(value)
+        else:
+            item = scan_plain_item(value)
+        if item is None:
+            return None
+        payload.append(item)
+
+    if not payload:
+        return None
+    return payload
+
+
+def parse_payload_text(text):
+    return scan_payload_lines(text.splitlines())
+
+
+def iter_mmap_lines(buffer):
+    for raw_line in iter(buffer.readline, b""):
+        yield raw_line.decode("utf-8")
+
+
+def load_payload_file_fast(file_path):
+    with file_path.open("rb") as f:
+        try:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return None
+        with buffer:
+            try:
+                return scan_payload_lines(iter_mmap_lines(buffer))
+            except UnicodeDecodeError:
+                return None
+
+
+def render_payload_item(item):
+    if is_plain_payload_item(item):
+        return f"- {item}\n"
+    return yaml.dump([item], Dumper=SafeDumper, allow_unicode=True, default_flow_style=False)
+
+
+def render_payload(payload):
+    """Render ``{"payload": [...]}`` exactly as ``yaml.dump`` would, without the emitter.
+
+    Items are written plain when SafeLoader reads them back as the same string;
+    anything else goes through PyYAML so its quoting stays authoritative.
+    """
+    if not payload:
+        return "payload: []\n"
+    return "payload:\n" + "".join(render_payload_item(item) for item in payload)
+
+
+def hash_text(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def hash_file(file_path):
+    try:
+        with file_path.open("rb") as f:
+            return hashlib.file_digest(f, "sha256").hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def get_temp_path(target_path):
+    return target_path.with_name(f".{target_path.name}.tmp")
+
+
+def stage_text_file(target_path, text, text_hash=None):
+    """Write ``text`` next to ``target_path`` unless the file already holds it.
+
+    Returns the temp path to rename into place, or None when the existing file
+    has the same SHA-256 and can be left untouched.
+    """
+    if text_hash is None:
+        text_hash = hash_text(text)
+    if hash_file(target_path) == text_hash:
+        return None
+    target_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = get_temp_path(target_path)
+    with temp_path.open("w", encoding="utf-8", newline="\n") as f:
+        f.write(text)
+    return temp_path
+
+
+def write_publish_report(report_path, changed, unchanged, deleted):
+    data = {
+        "changed": sorted(str(path) for path in changed),
+        "unchanged": sorted(str(path) for path in unchanged),
+        "deleted": sorted(str(path) for path in deleted),
+    }
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = get_temp_path(report_path)
+    temp_path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    temp_path.replace(report_path)
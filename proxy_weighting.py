@@ -0,0 +1,202 @@
+import concurrent.futures
+import os
+from pathlib import Path
+
+import yaml
+
+from payload_io import load_payload_file_fast
+from rule_index import DomainSuffixTrie, IntervalIndex
+from rule_record import DOMAIN_RULE_TYPES, IP_RULE_TYPES, format_rule, parse_rule
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+
+PROXY_FILENAMES = ("proxy.yaml",)
+SUPPORTED_WEIGHTING_MODES = {"exact", "semantic"}
+SHADOW_KINDS = ("exact", "suffix", "cidr")
+COMPARISON_IGNORED_OPTIONS = frozenset({"no-resolve"})
+DEFAULT_WEIGHTING_WORKERS = 1
+
+
+class RuleWeightingError(Exception):
+    """Raised when proxy rule weighting cannot complete safely."""
+
+
+def yaml_load(stream):
+    return yaml.load(stream, Loader=SafeLoader)
+
+
+def get_weighting_mode():
+    mode = os.environ.get("RULE_WEIGHTING_MODE", "exact").strip().lower()
+    if mode not in SUPPORTED_WEIGHTING_MODES:
+        raise RuleWeightingError(
+            f"RULE_WEIGHTING_MODE must be one of {sorted(SUPPORTED_WEIGHTING_MODES)}: {mode!r}"
+        )
+    return mode
+
+
+def get_weighting_workers():
+    raw_value = os.environ.get("RULE_WEIGHTING_WORKERS", str(DEFAULT_WEIGHTING_WORKERS))
+    try:
+        workers = int(raw_value)
+    except ValueError as exc:
+        raise RuleWeightingError(f"RULE_WEIGHTING_WORKERS must be an integer: {raw_value!r}") from exc
+    return max(1, workers)
+
+
+def load_yaml_file(file_path):
+    with file_path.open("r", encoding="utf-8") as f:
+        try:
+            data = yaml_load(f)
+        except yaml.YAMLError as exc:
+            raise RuleWeightingError(f"Invalid YAML in {file_path}: {exc}") from exc
+    return data
+
+
+def load_payload_file(file_path):
+    fast_payload = load_payload_file_fast(file_path)
+    if fast_payload is not None:
+        return fast_payload
+
+    data = load_yaml_file(file_path)
+    if not isinstance(data, dict):
+        raise RuleWeightingError(f"Rule file is not a mapping: {file_path}")
+    payload = data.get("payload")
+    if payload is None:
+        raise RuleWeightingError(f"Rule file has no payload node: {file_path}")
+    if not isinstance(payload, list):
+        raise RuleWeightingError(f"Rule file payload is not a list: {file_path}")
+    return payload
+
+
+def load_rules_payloads(rules_set_dir):
+    rules_payloads = {}
+    for rules_dir in iter_rules_dirs(rules_set_dir):
+        payloads = {}
+        for filename in sorted(os.listdir(rules_dir)):
+            file_path = rules_dir / filename
+            if not file_path.is_file() or file_path.suffix != ".yaml":
+                continue
+            payloads[filename] = load_payload_file(file_path)
+        rules_payloads[rules_dir] = payloads
+    return rules_payloads
+
+
+def collect_excluded_payloads(payloads, proxy_name):
+    excluded = set()
+    for filename, file_payloads in payloads.items():
+        if filename != proxy_name:
+            excluded.update(file_payloads)
+    return excluded
+
+
+def get_comparison_options(record):
+    return tuple(option for option in record.options if option not in COMPARISON_IGNORED_OPTIONS)
+
+
+def get_comparison_key(record):
+    if record.rule_type in DOMAIN_RULE_TYPES or record.rule_type in IP_RULE_TYPES:
+        return format_rule(record.rule_type, record.value, get_comparison_options(record))
+    return record.text
+
+
+def build_exclusion_index(excluded_payloads, mode):
+    index = {
+        "exact": set(excluded_payloads),
+        "normalized": set(),
+        "suffixes": {},
+        "networks": {},
+    }
+    if mode != "semantic":
+        return index
+
+    for item in excluded_payloads:
+        record = parse_rule(item)
+        options = get_comparison_options(record)
+        index["normalized"].add(get_comparison_key(record))
+        if record.rule_type == "DOMAIN-SUFFIX" and record.value:
+            index["suffixes"].setdefault(options, DomainSuffixTrie()).add(record.value)
+        elif record.rule_type in IP_RULE_TYPES and record.network is not None:
+            network = record.network
+            index["networks"].setdefault((network.version, options), IntervalIndex()).add(
+                int(network.network_address), int(network.broadcast_address)
+            )
+    return index
+
+
+def classify_shadowed(item, index):
+    if item in index["exact"]:
+        return "exact"
+    if not index["normalized"]:
+        return None
+
+    record = parse_rule(item)
+    if get_comparison_key(record) in index["normalized"]:
+        return "exact"
+    options = get_comparison_options(record)
+    if record.rule_type in {"DOMAIN", "DOMAIN-SUFFIX"} and record.value:
+        trie = index["suffixes"].get(options)
+        if trie is not None and trie.covers(record.value):
+            return "suffix"
+    elif record.rule_type in IP_RULE_TYPES and record.network is not None:
+        network = record.network
+        intervals = index["networks"].get((network.version, options))
+        if intervals is not None and intervals.covers(
+            int(network.network_address), int(network.broadcast_address)
+        ):
+            return "cidr"
+    return None
+
+
+def build_proxy_update(rules_dir, proxy_name, payloads, mode="exact"):
+    if proxy_name not in payloads:
+        return None
+
+    proxy_payloads = payloads[proxy_name]
+    exclusion_index = build_exclusion_index(collect_excluded_payloads(payloads, proxy_name), mode)
+    filtered_payloads = []
+    removed_by_kind = dict.fromkeys(SHADOW_KINDS, 0)
+    for payload in proxy_payloads:
+        shadow_kind = classify_shadowed(payload, exclusion_index)
+        if shadow_kind is None:
+            filtered_payloads.append(payload)
+        else:
+            removed_by_kind[shadow_kind] += 1
+
+    removed_count = len(proxy_payloads) - len(filtered_payloads)
+    return {
+        "file": rules_dir / proxy_name,
+        "payload": filtered_payloads,
+        "original": len(proxy_payloads),
+        "filtered": len(filtered_payloads),
+        "removed": removed_count,
+        "removed_by_kind": removed_by_kind,
+    }
+
+
+def build_proxy_updates(rules_payloads, mode="exact", workers=1):
+    """Weight every proxy file against the payloads of its own directory.
+
+    ``rules_payloads`` maps each rules directory to ``{filename: payload}`` and
+    is loaded once, so callers that already hold the payloads in memory can
+    pass them directly instead of rereading the files.
+    """
+    tasks = [
+        (rules_dir, proxy_name, payloads, mode)
+        for rules_dir, payloads in rules_payloads.items()
+        for proxy_name in PROXY_FILENAMES
+        if proxy_name in payloads
+    ]
+    if workers > 1 and len(tasks) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+            return list(executor.map(build_proxy_update, *zip(*tasks)))
+    return [build_proxy_update(*task) for task in tasks]
+
+
+def iter_rules_dirs(rules_set_dir):
+    for dirpath, dirnames, _ in os.walk(rules_set_dir):
+        dirnames.sort()
+        yield Path(dirpath)
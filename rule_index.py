@@ -0,0 +1,132 @@
+import bisect
+
+SUFFIX_TERMINAL = None
+
+
+class DomainSuffixTrie:
+    """Reversed-label trie answering whether a domain falls under a stored suffix."""
+
+    __slots__ = ("_root", "_size")
+
+    def __init__(self, suffixes=()):
+        self._root = {}
+        self._size = 0
+        for suffix in suffixes:
+            self.add(suffix)
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, domain):
+        return self.covers(domain)
+
+    def add(self, suffix):
+        node = self._root
+        for label in reversed(suffix.split(".")):
+            node = node.setdefault(label, {})
+        if SUFFIX_TERMINAL not in node:
+            node[SUFFIX_TERMINAL] = True
+            self._size += 1
+
+    def covers(self, domain, include_self=True):
+        labels = domain.split(".")
+        stop_index = 0 if include_self else 1
+        node = self._root
+        for index in range(len(labels) - 1, stop_index - 1, -1):
+            node = node.get(labels[index])
+            if node is None:
+                return False
+            if SUFFIX_TERMINAL in node:
+                return True
+        return False
+
+
+def find_covered_intervals(intervals):
+    """Return positions of (start, end, prefixlen) CIDR intervals nested in a strictly larger one."""
+    order = sorted(
+        range(len(intervals)), key=lambda position: (intervals[position][0], intervals[position][2])
+    )
+    covered = set()
+    top_end = -1
+    top_prefixlen = None
+    for position in order:
+        start, end, prefixlen = intervals[position]
+        if start <= top_end:
+            if prefixlen > top_prefixlen:
+                covered.add(position)
+            continue
+        top_end = end
+        top_prefixlen = prefixlen
+    return covered
+
+
+def summarize_interval(start, end, max_prefixlen):
+    while start <= end:
+        aligned_bits = (start & -start).bit_length() - 1 if start else max_prefixlen
+        size_bits = min(aligned_bits, (end - start + 1).bit_length() - 1)
+        yield start, max_prefixlen - size_bits
+        start += 1 << size_bits
+
+
+def collapse_intervals(intervals, max_prefixlen):
+    """Merge adjacent CIDR intervals into minimal blocks.
+
+    Yields ``(block_start, prefixlen, positions)`` where ``positions`` are the
+    input intervals that fall inside the block. Intervals must not partially
+    overlap, which holds for CIDR blocks once covered ones are removed.
+    """
+    order = sorted(range(len(intervals)), key=lambda position: intervals[position][0])
+    runs = []
+    for position in order:
+        start, end, _prefixlen = intervals[position]
+        if runs and start <= runs[-1][1] + 1:
+            runs[-1][1] = max(runs[-1][1], end)
+            runs[-1][2].append(position)
+        else:
+            runs.append([start, end, [position]])
+
+    for run_start, run_end, positions in runs:
+        member_index = 0
+        for block_start, prefixlen in summarize_interval(run_start, run_end, max_prefixlen):
+            block_end = block_start + (1 << (max_prefixlen - prefixlen)) - 1
+            members = []
+            while member_index < len(positions) and intervals[positions[member_index]][0] <= block_end:
+                members.append(positions[member_index])
+                member_index += 1
+            yield block_start, prefixlen, members
+
+
+class IntervalIndex:
+    """Union of integer intervals answering whether a query interval lies fully inside it."""
+
+    __slots__ = ("_pending", "_starts", "_ends")
+
+    def __init__(self, intervals=()):
+        self._pending = list(intervals)
+        self._starts = []
+        self._ends = []
+
+    def __len__(self):
+        self._merge()
+        return len(self._starts)
+
+    def add(self, start, end):
+        self._pending.append((start, end))
+
+    def _merge(self):
+        if not self._pending:
+            return
+        merged = []
+        for start, end in sorted([*zip(self._starts, self._ends), *self._pending]):
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        self._starts = [start for start, _end in merged]
+        self._ends = [end for _start, end in merged]
+        self._pending = []
+
+    def covers(self, start, end):
+        self._merge()
+        position = bisect.bisect_right(self._starts, start) - 1
+        return position >= 0 and self._ends[position] >= end
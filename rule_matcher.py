@@ -0,0 +1,455 @@
+import argparse
+import collections
+import ipaddress
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+import yaml
+
+from payload_io import load_payload_file_fast
+from rule_record import IP_RULE_TYPES, parse_rule
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+
+DEFAULT_INDEX_PATH = Path("./rules/rules.yaml")
+NO_MATCH = "-"
+IP_MAX_PREFIXLEN = {4: 32, 6: 128}
+
+
+class RuleMatchError(Exception):
+    """Raised when generated rule sets cannot be loaded for matching."""
+
+
+def yaml_load(stream):
+    return yaml.load(stream, Loader=SafeLoader)
+
+
+def keep_first(current, position):
+    return position if current is None or position < current else current
+
+
+class DomainMatcher:
+    """Reversed-label trie holding the first position of each DOMAIN / DOMAIN-SUFFIX rule.
+
+    Each node is ``[children, exact, suffix, subdomain]``: ``exact`` matches the
+    name itself, ``suffix`` the name and everything below it, ``subdomain`` only
+    names below it (the ``.example.com`` form of domain providers).
+    """
+
+    __slots__ = ("_root",)
+
+    def __init__(self):
+        self._root = [{}, None, None, None]
+
+    def _node(self, domain):
+        node = self._root
+        for label in reversed(domain.split(".")):
+            child = node[0].get(label)
+            if child is None:
+                child = node[0][label] = [{}, None, None, None]
+            node = child
+        return node
+
+    def add(self, domain, position, kind):
+        node = self._node(domain)
+        slot = {"exact": 1, "suffix": 2, "subdomain": 3}[kind]
+        node[slot] = keep_first(node[slot], position)
+
+    def match(self, host):
+        labels = host.split(".")
+        node = self._root
+        best = None
+        for index in range(len(labels) - 1, -1, -1):
+            node = node[0].get(labels[index])
+            if node is None:
+                break
+            if index:
+                candidates = (node[2], node[3])
+            else:
+                candidates = (node[1], node[2])
+            for position in candidates:
+                if position is not None:
+                    best = keep_first(best, position)
+        return best
+
+
+class KeywordMatcher:
+    """Aho-Corasick automaton over DOMAIN-KEYWORD values.
+
+    ``_output[state]`` is the first rule position among every keyword ending
+    at that state, including those reached through failure links.
+    """
+
+    __slots__ = ("_goto", "_fail", "_output", "_built")
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [None]
+        self._built = True
+
+    def __len__(self):
+        return sum(position is not None for position in self._output)
+
+    def add(self, keyword, position):
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(None)
+            state = next_state
+        self._output[state] = keep_first(self._output[state], position)
+        self._built = False
+
+    def _build(self):
+        queue = collections.deque(self._goto[0].values())
+        for state in queue:
+            self._fail[state] = 0
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                fail_state = self._fail[state]
+                while fail_state and char not in self._goto[fail_state]:
+                    fail_state = self._fail[fail_state]
+                fallback = self._goto[fail_state].get(char, 0)
+                self._fail[next_state] = fallback if fallback != next_state else 0
+                inherited = self._output[self._fail[next_state]]
+                if inherited is not None:
+                    self._output[next_state] = keep_first(self._output[next_state], inherited)
+                queue.append(next_state)
+        self._built = True
+
+    def match(self, text):
+        if not self._built:
+            self._build()
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        state = 0
+        best = None
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            position = output[state]
+            if position is not None and (best is None or position < best):
+                best = position
+        return best
+
+
+class RegexMatcher:
+    """DOMAIN-REGEX rules checked against one combined pattern before the individual ones."""
+
+    __slots__ = ("_patterns", "_combined")
+
+    def __init__(self):
+        self._patterns = []
+        self._combined = None
+
+    def __len__(self):
+        return len(self._patterns)
+
+    def add(self, pattern, position):
+        try:
+            compiled = re.compile(pattern)
+        except re.error:
+            return False
+        self._patterns.append((position, compiled))
+        self._combined = None
+        return True
+
+    def match(self, host):
+        if not self._patterns:
+            return None
+        if self._combined is None:
+            try:
+                pattern = "|".join(f"(?:{compiled.pattern})" for _position, compiled in self._patterns)
+                self._combined = re.compile(pattern)
+            except re.error:
+                # Backreferences or inline flags cannot be combined; check patterns one by one.
+                self._combined = False
+        if self._combined and not self._combined.search(host):
+            return None
+        for position, compiled in self._patterns:
+            if compiled.search(host):
+                return position
+        return None
+
+
+class NetworkMatcher:
+    """IP-CIDR rules bucketed by prefix length; a lookup probes one dict per length present."""
+
+    __slots__ = ("_tables",)
+
+    def __init__(self):
+        self._tables = {4: {}, 6: {}}
+
+    def __len__(self):
+        return sum(len(table) for tables in self._tables.values() for table in tables.values())
+
+    def add(self, network, position):
+        shift = IP_MAX_PREFIXLEN[network.version] - network.prefixlen
+        table = self._tables[network.version].setdefault(network.prefixlen, {})
+        key = int(network.network_address) >> shift
+        table[key] = keep_first(table.get(key), position)
+
+    def match(self, address):
+        max_prefixlen = IP_MAX_PREFIXLEN[address.version]
+        value = int(address)
+        best = None
+        for prefixlen, table in self._tables[address.version].items():
+            position = table.get(value >> (max_prefixlen - prefixlen))
+            if position is not None and (best is None or position < best):
+                best = position
+        return best
+
+
+class RuleMatcher:
+    """All generated rule sets compiled for offline lookups.
+
+    Rules are numbered in index order and then payload order, so a query is
+    answered by the first rule a client would hit if it listed every rule set
+    in the order of the index.
+    """
+
+    def __init__(self):
+        self.rule_sets = []
+        self.missing = []
+        self.rules = []
+        self.unsupported = collections.Counter()
+        self.domains = DomainMatcher()
+        self.keywords = KeywordMatcher()
+        self.regexes = RegexMatcher()
+        self.networks = NetworkMatcher()
+
+    def add_rule_set(self, name, behavior, payload):
+        self.rule_sets.append(name)
+        for item in payload:
+            if not isinstance(item, str):
+                self.unsupported["invalid"] += 1
+                continue
+            position = len(self.rules)
+            if self.add_item(behavior, item, position):
+                self.rules.append((name, item))
+
+    def add_item(self, behavior, item, position):
+        if behavior == "domain":
+            return self.add_domain_item(item, position)
+        if behavior == "ipcidr":
+            return self.add_network(item, position, "ipcidr")
+
+        record = parse_rule(item)
+        if not record.value:
+            self.unsupported["invalid"] += 1
+            return False
+        if record.rule_type == "DOMAIN":
+            self.domains.add(record.value, position, "exact")
+        elif record.rule_type == "DOMAIN-SUFFIX":
+            self.domains.add(record.value, position, "suffix")
+        elif record.rule_type == "DOMAIN-KEYWORD":
+            self.keywords.add(record.value, position)
+        elif record.rule_type == "DOMAIN-REGEX":
+            if not self.regexes.add(record.value, position):
+                self.unsupported["DOMAIN-REGEX"] += 1
+                return False
+        elif record.rule_type in IP_RULE_TYPES and record.network is not None:
+            self.networks.add(record.network, position)
+        else:
+            self.unsupported[record.rule_type or "invalid"] += 1
+            return False
+        return True
+
+    def add_domain_item(self, item, position):
+        value = item.strip().lower().rstrip(".")
+        if value.startswith("+."):
+            self.domains.add(value[2:], position, "suffix")
+        elif value.startswith("."):
+            self.domains.add(value[1:], position, "subdomain")
+        elif value and "*" not in value:
+            self.domains.add(value, position, "exact")
+        else:
+            self.unsupported["domain-wildcard"] += 1
+            return False
+        return True
+
+    def add_network(self, item, position, kind):
+        try:
+            network = ipaddress.ip_network(item.strip(), strict=False)
+        except ValueError:
+            self.unsupported[kind] += 1
+            return False
+        self.networks.add(network, position)
+        return True
+
+    def match_position(self, query):
+        host = query.strip().lower().rstrip(".")
+        try:
+            address = ipaddress.ip_address(host.strip("[]"))
+        except ValueError:
+            address = None
+        if address is not None:
+            return self.networks.match(address)
+
+        best = self.domains.match(host)
+        for matcher in (self.keywords, self.regexes):
+            position = matcher.match(host)
+            if position is not None and (best is None or position < best):
+                best = position
+        return best
+
+    def match(self, query):
+        """Return ``(rule_set, rule)`` for the first matching rule, or None.
+
+        Hostnames are not resolved, so IP rules only answer IP literal queries.
+        """
+        position = self.match_position(query)
+        if position is None:
+            return None
+        return self.rules[position]
+
+
+def load_payload(file_path):
+    fast_payload = load_payload_file_fast(file_path)
+    if fast_payload is not None:
+        return fast_payload
+
+    with file_path.open("r", encoding="utf-8") as f:
+        try:
+            data = yaml_load(f)
+        except yaml.YAMLError as exc:
+            raise RuleMatchError(f"Invalid YAML in {file_path}: {exc}") from exc
+    payload = data.get("payload") if isinstance(data, dict) else None
+    if not isinstance(payload, list):
+        raise RuleMatchError(f"Rule file has no payload list: {file_path}")
+    return payload
+
+
+def load_rule_matcher(index_path=DEFAULT_INDEX_PATH):
+    try:
+        with index_path.open("r", encoding="utf-8") as f:
+            index = yaml_load(f)
+    except FileNotFoundError as exc:
+        raise RuleMatchError(f"Rule index not found: {index_path}") from exc
+    except yaml.YAMLError as exc:
+        raise RuleMatchError(f"Invalid YAML in {index_path}: {exc}") from exc
+    if not isinstance(index, dict):
+        raise RuleMatchError(f"Rule index is not a mapping: {index_path}")
+
+    matcher = RuleMatcher()
+    for name, entry in index.items():
+        if not isinstance(entry, dict) or not isinstance(entry.get("path"), str):
+            raise RuleMatchError(f"Rule index entry {name!r} has no path: {index_path}")
+        if entry.get("format", "yaml") != "yaml":
+            continue
+        file_path = index_path.parent / entry["path"]
+        try:
+            payload = load_payload(file_path)
+        except FileNotFoundError:
+            matcher.missing.append(file_path)
+            continue
+        matcher.add_rule_set(name, entry.get("behavior", "classical"), payload)
+    return matcher
+
+
+def iter_query_lines(file_path):
+    with file_path.open("r", encoding="utf-8") as f:
+        for line in f:
+            fields = line.partition("#")[0].split()
+            if fields:
+                yield fields[0], fields[1] if len(fields) > 1 else None
+
+
+def format_result(query, result, expected=None, as_json=False):
+    rule_set, rule = result or (None, None)
+    if as_json:
+        data = {"query": query, "rule_set": rule_set, "rule": rule}
+        if expected is not None:
+            data["expected"] = expected
+        return json.dumps(data, ensure_ascii=False)
+    line = f"{query}\t{NO_MATCH}" if result is None else f"{query}\t{rule_set}\t{rule}"
+    return f"{line}\texpected={expected}" if expected is not None else line
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="Look up which generated rule set and rule match a host or IP."
+    )
+    parser.add_argument("queries", nargs="*", help="hostnames or IP addresses")
+    parser.add_argument("--index", type=Path, default=DEFAULT_INDEX_PATH, help="rule set index to load")
+    parser.add_argument(
+        "--file",
+        type=Path,
+        help="read one query per line; an optional second column is the expected rule set (- for no match)",
+    )
+    parser.add_argument("--json", action="store_true", help="print one JSON object per query")
+    parser.add_argument(
+        "--quiet", action="store_true", help="only print queries that miss their expected rule set"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.queries and not args.file:
+        print("Rule match failed: pass a query or --file", file=sys.stderr)
+        return 1
+
+    started_at = time.perf_counter()
+    try:
+        matcher = load_rule_matcher(args.index)
+    except RuleMatchError as exc:
+        print(f"Rule match failed: {exc}", file=sys.stderr)
+        return 1
+    compiled_at = time.perf_counter()
+    for file_path in matcher.missing:
+        print(f"Skipped missing rule set: {file_path}", file=sys.stderr)
+
+    queries = [(query, None) for query in args.queries]
+    if args.file:
+        try:
+            queries.extend(iter_query_lines(args.file))
+        except OSError as exc:
+            print(f"Rule match failed: {exc}", file=sys.stderr)
+            return 1
+
+    results = {}
+    mismatches = 0
+    output = []
+    for query, expected in queries:
+        if query not in results:
+            results[query] = matcher.match(query)
+        result = results[query]
+        mismatch = expected is not None and expected != (result[0] if result else NO_MATCH)
+        mismatches += mismatch
+        if not args.quiet or mismatch:
+            output.append(format_result(query, result, expected if mismatch else None, args.json))
+    if output:
+        print("\n".join(output), flush=True)
+
+    finished_at = time.perf_counter()
+    unsupported = ", ".join(
+        f"{rule_type}={count}" for rule_type, count in sorted(matcher.unsupported.items())
+    )
+    print(
+        f"Matched {len(queries)} queries against {len(matcher.rule_sets)} rule sets / "
+        f"{len(matcher.rules)} rules: "
+        f"compile={compiled_at - started_at:.2f}s, match={finished_at - compiled_at:.2f}s, "
+        f"mismatches={mismatches}, skipped=({unsupported or 'none'})",
+        file=sys.stderr,
+    )
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+import ipaddress
+
+DOMAIN_RULE_TYPES = frozenset({"DOMAIN", "DOMAIN-SUFFIX", "DOMAIN-KEYWORD"})
+IP_RULE_TYPES = frozenset({"IP-CIDR", "IP-CIDR6"})
+
+
+class RuleRecord:
+    """A payload rule split into type, value and options exactly once.
+
+    ``text`` is the normalized rule string used for output and equality, so
+    rules that only differ in case, whitespace or a trailing dot compare equal.
+    ``original`` keeps the item as it was read.
+    """
+
+    __slots__ = ("rule_type", "value", "options", "network", "original", "text")
+
+    def __init__(self, rule_type, value, options, text, original, network=None):
+        self.rule_type = rule_type
+        self.value = value
+        self.options = options
+        self.network = network
+        self.original = original
+        self.text = text
+
+    def __eq__(self, other):
+        if not isinstance(other, RuleRecord):
+            return NotImplemented
+        return self.text == other.text
+
+    def __hash__(self):
+        return hash(self.text)
+
+    def __repr__(self):
+        return f"RuleRecord({self.text!r})"
+
+
+def format_rule(rule_type, value, options=()):
+    return ",".join((rule_type, value, *options))
+
+
+def format_network(network):
+    if network.version == 6 and network.network_address.ipv4_mapped is not None:
+        return f"::ffff:{network.network_address.ipv4_mapped}/{network.prefixlen}"
+    return str(network)
+
+
+def parse_rule(item):
+    if not isinstance(item, str):
+        return RuleRecord(None, "", (), item, item)
+
+    rule_type, separator, rest = item.partition(",")
+    rule_type = rule_type.strip().upper()
+    if not separator:
+        return RuleRecord(rule_type, "", (), item, item)
+
+    if rule_type in DOMAIN_RULE_TYPES:
+        value, *options = (part.strip() for part in rest.split(","))
+        value = value.lower()
+        if rule_type != "DOMAIN-KEYWORD":
+            value = value.rstrip(".")
+        if not value:
+            return RuleRecord(rule_type, "", (), item, item)
+        options = tuple(options)
+        return RuleRecord(rule_type, value, options, format_rule(rule_type, value, options), item)
+
+    if rule_type in IP_RULE_TYPES:
+        value, *options = (part.strip() for part in rest.split(","))
+        try:
+            network = ipaddress.ip_network(value, strict=False)
+        except ValueError:
+            return RuleRecord(rule_type, value, (), item, item)
+        value = format_network(network)
+        options = tuple(option.lower() for option in options)
+        return RuleRecord(rule_type, value, options, format_rule(rule_type, value, options), item, network)
+
+    return RuleRecord(rule_type, rest.strip(), (), item, item)
+
+
+def to_behavior_item(record):
+    """Return ``(behavior, item)`` when a rule fits a domain or ipcidr provider, else None.
+
+    Rule options such as ``no-resolve`` are dropped; for behavior providers they
+    belong on the ``RULE-SET`` line of the client config instead.
+    """
+    if record.rule_type == "DOMAIN" and record.value:
+        return "domain", record.value
+    if record.rule_type == "DOMAIN-SUFFIX" and record.value:
+        return "domain", f"+.{record.value}"
+    if record.rule_type in IP_RULE_TYPES and record.network is not None:
+        return "ipcidr", record.value
+    return None
+
+
+def split_behavior_payloads(payload):
+    behavior_payloads = {"domain": [], "ipcidr": [], "classical": []}
+    for item in payload:
+        behavior_item = to_behavior_item(parse_rule(item))
+        if behavior_item is None:
+            behavior_payloads["classical"].append(item)
+        else:
+            behavior_payloads[behavior_item[0]].append(behavior_item[1])
+    return behavior_payloads
@@ -0,0 +1,30 @@
+import importlib.util
+import sys
+from pathlib import Path
+
+import pytest
+
+
+REPO_DIR = Path(__file__).resolve().parents[1]
+MERGE_SCRIPT = REPO_DIR / "01.merge_rules.py"
+WEIGHTING_SCRIPT = REPO_DIR / "02.rule_weighting.py"
+
+sys.path.insert(0, str(REPO_DIR))
+
+
+def load_script(module_name, script_path):
+    spec = importlib.util.spec_from_file_location(module_name, script_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope="session")
+def merge():
+    return load_script("merge_rules", MERGE_SCRIPT)
+
+
+@pytest.fixture(scope="session")
+def weighting():
+    return load_script("rule_weighting", WEIGHTING_SCRIPT)
@@ -0,0 +1,175 @@
+import io
+import tarfile
+
+import pytest
+
+
+GEOSITE_TYPES = {"keyword": 0, "regexp": 1, "domain": 2, "full": 3}
+
+
+def encode_varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def encode_bytes_field(field_number, payload):
+    return encode_varint(field_number << 3 | 2) + encode_varint(len(payload)) + payload
+
+
+def encode_varint_field(field_number, value):
+    return encode_varint(field_number << 3) + encode_varint(value)
+
+
+def encode_geosite_list(sites):
+    data = b""
+    for name, domains in sites.items():
+        site = encode_bytes_field(1, name.encode("utf-8"))
+        for domain in domains:
+            rule_type, value, attributes = domain
+            message = b""
+            type_number = GEOSITE_TYPES.get(rule_type, rule_type)
+            if type_number:
+                message += encode_varint_field(1, type_number)
+            message += encode_bytes_field(2, value.encode("utf-8"))
+            for attribute in attributes:
+                # Attribute {key = 1; bool_value = 2}
+                key = encode_bytes_field(1, attribute.encode("utf-8"))
+                message += encode_bytes_field(3, key + encode_varint_field(2, 1))
+            site += encode_bytes_field(2, message)
+        data += encode_bytes_field(1, site)
+    return data
+
+
+def encode_tarball(files, prefix="domain-list-community-master/"):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        for name, content in files.items():
+            data = content if isinstance(content, bytes) else content.encode("utf-8")
+            member = tarfile.TarInfo(prefix + name)
+            member.size = len(data)
+            tar.addfile(member, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def load_archive(merge, tmp_path, monkeypatch):
+    """Write ``data`` as the DLC archive and return a resolver over a fresh DLC state."""
+    monkeypatch.chdir(tmp_path)
+
+    def load(data):
+        archive_path = tmp_path / "dlc.archive"
+        archive_path.write_bytes(data)
+        monkeypatch.setenv("RULE_DLC_ARCHIVE", str(archive_path))
+        dlc_cache = {}
+        dlc_state = {"repo_ready": False, "commit": None, "deps": {}}
+        repo_dir = merge.get_dlc_repo_dir()
+
+        def resolve(dlc_name):
+            source_item = {"url": f"https://example.com/data/{dlc_name}", "format": "dlc", "name": dlc_name}
+            return merge.download_dlc_payload(source_item, dlc_cache, repo_dir, dlc_state)
+
+        return resolve
+
+    return load
+
+
+def test_geosite_entries_decode_types_and_attributes(merge):
+    data = encode_geosite_list(
+        {
+            "GOOGLE": [
+                ("domain", "google.com", ()),
+                ("full", "www.google.com", ("cn",)),
+                ("keyword", "goog", ()),
+                ("regexp", r"^g\d\.com$", ("ads", "cn")),
+            ]
+        }
+    )
+    entries = merge.read_geosite_entries(data)
+    assert list(entries) == ["google"]
+    assert merge.parse_geosite_rules(entries["google"]) == [
+        ("domain", "google.com", ()),
+        ("full", "www.google.com", ("cn",)),
+        ("keyword", "goog", ()),
+        ("regexp", r"^g\d\.com$", ("ads", "cn")),
+    ]
+
+
+def test_geosite_archive_resolves_offline(load_archive):
+    resolve = load_archive(
+        encode_geosite_list({"EXAMPLE": [("domain", "example.com", ()), ("full", "a.b.com", ())]})
+    )
+    assert resolve("example") == ["DOMAIN-SUFFIX,example.com", "DOMAIN,a.b.com"]
+
+
+def test_tarball_archive_reads_only_data_files(merge, tmp_path):
+    archive_path = tmp_path / "dlc.tar.gz"
+    archive_path.write_bytes(
+        encode_tarball({"data/a": "a.com\n", "README.md": "docs\n", "data/nested/b": "b.com\n"})
+    )
+    archive = merge.load_dlc_archive(archive_path)
+    assert archive["format"] == "tarball"
+    assert set(archive["entries"]) == {"a"}
+
+
+def test_tarball_archive_expands_includes_with_filters(load_archive):
+    resolve = load_archive(
+        encode_tarball(
+            {
+                "data/main": "main.com\ninclude:ads @ads\n",
+                "data/ads": "tracker.com @ads\nplain.com\n",
+            }
+        )
+    )
+    assert resolve("main") == ["DOMAIN-SUFFIX,main.com", "DOMAIN-SUFFIX,tracker.com"]
+
+
+def test_corrupt_tarball_entry_raises_its_parse_error(merge, load_archive):
+    resolve = load_archive(
+        encode_tarball(
+            {
+                "data/good": "good.com\n",
+                "data/bad": "unknown:value\n",
+                "data/parent": "include:bad\n",
+            }
+        )
+    )
+    assert resolve("good") == ["DOMAIN-SUFFIX,good.com"]
+    for dlc_name in ("bad", "parent"):
+        with pytest.raises(merge.RuleUpdateError, match="Unsupported DLC rule type 'unknown'"):
+            resolve(dlc_name)
+
+
+def test_corrupt_geosite_entry_raises_its_decode_error(merge, load_archive):
+    resolve = load_archive(
+        encode_geosite_list({"GOOD": [("domain", "good.com", ())], "BAD": [(9, "bad.com", ())]})
+    )
+    assert resolve("good") == ["DOMAIN-SUFFIX,good.com"]
+    with pytest.raises(merge.RuleUpdateError, match="unsupported geosite domain type 9"):
+        resolve("bad")
+
+
+def test_missing_archive_name_reports_missing(merge, load_archive):
+    resolve = load_archive(encode_tarball({"data/a": "a.com\n"}))
+    with pytest.raises(merge.RuleUpdateError, match="does not exist"):
+        resolve("other")
+
+
+def test_unknown_archive_format_is_rejected(merge, load_archive):
+    resolve = load_archive(b"\xff\xff\xff\xff not an archive")
+    with pytest.raises(merge.RuleUpdateError, match="neither a repository tarball nor geosite data"):
+        resolve("a")
+
+
+def test_archive_update_reparses_changed_entries_only(merge, load_archive, capsys):
+    files = {"data/a": "a.com\n", "data/b": "include:a\n", "data/c": "c.com\n"}
+    load_archive(encode_tarball(files))("c")
+    resolve = load_archive(encode_tarball({**files, "data/a": "new-a.com\n"}))
+    assert resolve("b") == ["DOMAIN-SUFFIX,new-a.com"]
+    assert "changed=1, invalidated=2" in capsys.readouterr().out
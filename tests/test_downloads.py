@@ -0,0 +1,119 @@
+import asyncio
+import http.server
+import threading
+
+import pytest
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers.get("If-None-Match")))
+        count = sum(1 for path, _etag in self.server.requests if path == self.path)
+        if self.path == "/static":
+            if self.headers.get("If-None-Match") == '"v1"':
+                self.send_response(304)
+                self.send_header("ETag", '"v1"')
+                self.end_headers()
+                return
+            self.reply(200, "static-body", etag='"v1"')
+        elif self.path == "/flaky":
+            self.reply(503, "busy") if count == 1 else self.reply(200, "flaky-body")
+        elif self.path == "/mirror/broken":
+            self.reply(200, "mirror-body")
+        else:
+            self.reply(500, "broken")
+
+    def reply(self, status, body, etag=None):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(data)))
+        if etag:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server(merge, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("NO_PROXY", "127.0.0.1")
+    monkeypatch.delenv("RULE_HTTP_CACHE", raising=False)
+    monkeypatch.delenv("RULE_HTTP_CACHE_MAX_AGE", raising=False)
+    monkeypatch.setattr(merge, "get_retry_delay", lambda attempt: 0)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.requests = []
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    monkeypatch.setattr(
+        merge,
+        "get_github_raw_fallback_url",
+        lambda url: url.replace(base_url, f"{base_url}/mirror") if url.endswith("/broken") else None,
+    )
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True)
+    thread.start()
+    merge.reset_http_cache_stats()
+    yield server, base_url
+    server.shutdown()
+    server.server_close()
+
+
+def download_async(merge, urls):
+    pytest.importorskip("httpx")
+    results = {}
+
+    def on_done(url, text, error):
+        results[url] = (text, error)
+
+    asyncio.run(merge.download_texts_async(urls, on_done))
+    return results
+
+
+def test_async_engine_revalidates_cached_body_with_304(merge, stub_server):
+    server, base_url = stub_server
+    url = f"{base_url}/static"
+    assert download_async(merge, [url]) == {url: ("static-body", None)}
+    assert download_async(merge, [url]) == {url: ("static-body", None)}
+    assert server.requests == [("/static", None), ("/static", '"v1"')]
+    assert merge.HTTP_CACHE_STATS == {"hit": 0, "revalidated": 1, "miss": 1}
+
+
+def test_async_engine_retries_then_succeeds(merge, stub_server, capsys):
+    server, base_url = stub_server
+    url = f"{base_url}/flaky"
+    assert download_async(merge, [url]) == {url: ("flaky-body", None)}
+    assert [path for path, _etag in server.requests] == ["/flaky", "/flaky"]
+    assert f"Download recovered for {url} on attempt 2/" in capsys.readouterr().out
+
+
+def test_async_engine_uses_fallback_after_failed_attempts(merge, stub_server, capsys):
+    server, base_url = stub_server
+    url = f"{base_url}/broken"
+    assert download_async(merge, [url]) == {url: ("mirror-body", None)}
+    assert [path for path, _etag in server.requests] == ["/broken"] * merge.FALLBACK_AFTER_ATTEMPTS + [
+        "/mirror/broken"
+    ]
+    assert f"via fallback {base_url}/mirror/broken" in capsys.readouterr().out
+
+
+def test_async_engine_reports_exhausted_attempts(merge, stub_server, monkeypatch):
+    server, base_url = stub_server
+    monkeypatch.setattr(merge, "MAX_DOWNLOAD_ATTEMPTS", 3)
+    url = f"{base_url}/gone"
+    text, error = download_async(merge, [url])[url]
+    assert text is None
+    assert isinstance(error, merge.RuleUpdateError)
+    assert f"Failed to download {url} after 3 attempts" in str(error)
+    assert len(server.requests) == 3
+
+
+def test_thread_engine_shares_the_cache_and_fallback_logic(merge, stub_server, monkeypatch):
+    server, base_url = stub_server
+    monkeypatch.setattr(merge, "FALLBACK_AFTER_ATTEMPTS", 1)
+    session = merge.requests.Session()
+    assert merge.get_url_text(f"{base_url}/static", session) == "static-body"
+    assert merge.get_url_text(f"{base_url}/static", session) == "static-body"
+    assert merge.get_url_text(f"{base_url}/broken", session) == "mirror-body"
+    assert [path for path, _etag in server.requests] == ["/static", "/static", "/broken", "/mirror/broken"]
+    assert merge.HTTP_CACHE_STATS == {"hit": 0, "revalidated": 1, "miss": 2}
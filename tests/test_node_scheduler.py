@@ -0,0 +1,161 @@
+import multiprocessing
+import threading
+from pathlib import Path
+
+import pytest
+
+
+BASE_URL = "https://raw.githubusercontent.com/o/r/master"
+TEXTS = {
+    f"{BASE_URL}/A.yaml": (
+        "payload:\n- DOMAIN,x.example.com\n- DOMAIN-SUFFIX,example.com\n- IP-CIDR,10.0.0.0/8\n"
+    ),
+    f"{BASE_URL}/B.yaml": (
+        "payload:\n- DOMAIN-SUFFIX,b.example.com\n- IP-CIDR,10.1.0.0/16\n- PROCESS-NAME,b.exe\n"
+    ),
+    f"{BASE_URL}/C.yaml": "payload:\n- DOMAIN,c.example.org\n- DOMAIN-KEYWORD,tracker\n",
+    f"{BASE_URL}/D.yaml": "payload:\n- DOMAIN-SUFFIX,d.example.net\n- IP-CIDR6,2001:db8::/32\n",
+    f"{BASE_URL}/A_No_Resolve.yaml": (
+        "payload:\n- DOMAIN,x.example.com\n- DOMAIN-SUFFIX,example.com\n- IP-CIDR,10.0.0.0/8,no-resolve\n"
+    ),
+    f"{BASE_URL}/B_No_Resolve.yaml": (
+        "payload:\n- DOMAIN-SUFFIX,b.example.com\n- IP-CIDR,10.1.0.0/16,no-resolve\n- PROCESS-NAME,b.exe\n"
+    ),
+}
+NODES = {
+    "a.yaml": ("a", ["A.yaml", "B.yaml"]),
+    "b.yaml": ("b", ["B.yaml", "C.yaml"]),
+    "c.yaml": ("c", ["D.yaml"]),
+    "no_resolve/a_no_resolve.yaml": ("a", ["A_No_Resolve.yaml", "B_No_Resolve.yaml"]),
+}
+
+
+def write_node(path, node_name, file_names):
+    urls = "".join(f"  - {BASE_URL}/{file_name}\n" for file_name in file_names)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(f"{node_name}:\n  type: http\n  behavior: classical\n  urls:\n{urls}", encoding="utf-8")
+
+
+@pytest.fixture
+def source_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for rel_path, (node_name, file_names) in NODES.items():
+        write_node(tmp_path / "source" / rel_path, node_name, file_names)
+    return Path("source")
+
+
+@pytest.fixture
+def schedulers(merge, monkeypatch):
+    """Record every scheduler a build creates, so tests can look at its state after ``run``."""
+    created = []
+
+    class RecordingScheduler(merge.NodeScheduler):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            created.append(self)
+
+    monkeypatch.setattr(merge, "NodeScheduler", RecordingScheduler)
+    return created
+
+
+def fake_downloads(merge, monkeypatch, order=None, failed=()):
+    """Replace the download engine with one that delivers ``urls`` in ``order`` from a background thread."""
+    requested = []
+
+    def start_text_downloads(urls, on_done):
+        requested.extend(urls)
+        delivery = sorted(urls, key=order.index) if order is not None else list(urls)
+
+        def deliver():
+            for url in delivery:
+                if url in failed:
+                    on_done(url, None, merge.RuleUpdateError(f"boom {url}"))
+                else:
+                    on_done(url, TEXTS[url], None)
+
+        thread = threading.Thread(target=deliver)
+        thread.start()
+
+        def finish(cancel=False):
+            thread.join()
+            return "with fake engine"
+
+        return finish
+
+    monkeypatch.setattr(merge, "start_text_downloads", start_text_downloads)
+    return requested
+
+
+def build(merge, source_dir):
+    generated_rules, _generated_indexes, stats, build_manifest = merge.collect_generated_rules(source_dir)
+    stats.pop("timings")
+    return generated_rules, list(generated_rules), stats, build_manifest
+
+
+@pytest.fixture
+def build_modes(merge, source_dir, monkeypatch):
+    def run(mode, workers=1, order=None):
+        monkeypatch.setenv("RULE_NO_RESOLVE_MODE", mode)
+        monkeypatch.setenv("RULE_PROCESS_WORKERS", str(workers))
+        fake_downloads(merge, monkeypatch, order)
+        return build(merge, source_dir)
+
+    return run
+
+
+@pytest.mark.parametrize("mode", ["source", "derive", "verify"])
+def test_out_of_order_downloads_match_in_order_build(merge, build_modes, schedulers, mode):
+    expected = build_modes(mode)
+    assert expected[1] == ["a.yaml", "b.yaml", "c.yaml", "no_resolve/a.yaml"]
+    for order in (list(reversed(TEXTS)), sorted(TEXTS, key=lambda url: url[::-1])):
+        assert build_modes(mode, order=order) == expected
+    for scheduler in schedulers:
+        assert scheduler.downloaded_texts == {}
+        assert scheduler.payload_cache == {}
+        assert not +scheduler.url_readers
+        assert not +scheduler.payload_readers
+
+
+@pytest.mark.parametrize("mode", ["source", "derive", "verify"])
+def test_process_pool_matches_sequential_build(merge, build_modes, mode):
+    if multiprocessing.get_start_method() != "fork":
+        pytest.skip("workers import the script by module name, which only fork provides")
+    expected = build_modes(mode)
+    assert build_modes(mode, workers=2, order=list(reversed(TEXTS))) == expected
+
+
+def test_derive_mode_skips_no_resolve_downloads(merge, build_modes, monkeypatch, capsys):
+    source_rules = build_modes("source")[0]
+    monkeypatch.setenv("RULE_NO_RESOLVE_MODE", "derive")
+    requested = fake_downloads(merge, monkeypatch)
+    capsys.readouterr()
+    derived_rules = build(merge, Path("source"))[0]
+    assert not any("_No_Resolve" in url for url in requested)
+    assert "Derived source/no_resolve/a_no_resolve.yaml::a" in capsys.readouterr().out
+    assert derived_rules == source_rules
+
+
+def test_verify_mode_reports_matching_sources(merge, source_dir, monkeypatch, capsys):
+    monkeypatch.setenv("RULE_NO_RESOLVE_MODE", "verify")
+    fake_downloads(merge, monkeypatch, order=list(reversed(TEXTS)))
+    build(merge, source_dir)
+    assert "Verified derived no-resolve rules: nodes=1, mismatched=0" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("mode", ["source", "verify"])
+def test_failed_url_blocks_only_its_group(merge, source_dir, schedulers, monkeypatch, capsys, mode):
+    monkeypatch.setenv("RULE_NO_RESOLVE_MODE", mode)
+    failed_url = f"{BASE_URL}/C.yaml"
+    fake_downloads(merge, monkeypatch, order=list(reversed(TEXTS)), failed={failed_url})
+    with pytest.raises(merge.RuleUpdateError, match="Failed to download 1 source URL") as excinfo:
+        merge.collect_generated_rules(source_dir)
+    assert f"boom {failed_url}" in str(excinfo.value)
+
+    scheduler = schedulers[-1]
+    assert sorted(scheduler.generated_rules) == ["a.yaml", "c.yaml", "no_resolve/a.yaml"]
+    out = capsys.readouterr().out
+    assert "Processed source/a.yaml::a" in out
+    assert "Processed source/c.yaml::c" in out
+    assert "source/b.yaml::b" not in out
+    # B.yaml is still held for the blocked group; everything else was released.
+    assert list(scheduler.downloaded_texts) == [f"{BASE_URL}/B.yaml"]
@@ -0,0 +1,107 @@
+import multiprocessing
+import subprocess
+import threading
+from pathlib import Path
+
+import pytest
+import yaml
+
+
+DLC_URL = "https://raw.githubusercontent.com/v2fly/domain-list-community/master/data/example"
+DLC_DATA = "domain:example.com\nfull:www.example.org\nregexp:^ad[0-9]+\\.example\\.net$\nregexp:^x\\.\n"
+BASE_URL = "https://raw.githubusercontent.com/o/r/master"
+TEXTS = {
+    f"{BASE_URL}/A.yaml": "payload:\n- DOMAIN,a.example.io\n",
+    f"{BASE_URL}/B.yaml": "payload:\n- DOMAIN,b.example.io\n",
+}
+CONVERTED_LINE = f"Converted 2 regexp rules from DLC source {DLC_URL} to DOMAIN-REGEX"
+
+
+def git(*args, cwd):
+    subprocess.run(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+        cwd=cwd,
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+
+
+@pytest.fixture
+def dlc_repo(merge, tmp_path, monkeypatch):
+    """A local domain-list-community checkout; syncing it is a no-op."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("RULE_DLC_ARCHIVE", raising=False)
+    repo_dir = Path(".cache/domain-list-community")
+    (repo_dir / "data").mkdir(parents=True)
+    (repo_dir / "data" / "example").write_text(DLC_DATA, encoding="utf-8")
+    git("init", "-q", cwd=repo_dir)
+    git("add", "data", cwd=repo_dir)
+    git("commit", "-q", "-m", "data", cwd=repo_dir)
+    monkeypatch.setattr(merge, "ensure_dlc_repo", lambda repo_dir: None)
+    return repo_dir
+
+
+def write_nodes(source_dir, nodes):
+    source_dir.mkdir()
+    for node_name, urls in nodes.items():
+        node_data = {"type": "http", "behavior": "classical", "urls": urls}
+        (source_dir / f"{node_name}.yaml").write_text(yaml.safe_dump({node_name: node_data}), encoding="utf-8")
+
+
+def fake_downloads(merge, monkeypatch, order):
+    def start_text_downloads(urls, on_done):
+        thread = threading.Thread(
+            target=lambda: [on_done(url, TEXTS[url], None) for url in sorted(urls, key=order.index)]
+        )
+        thread.start()
+
+        def finish(cancel=False):
+            thread.join()
+            return "with fake engine"
+
+        return finish
+
+    monkeypatch.setattr(merge, "start_text_downloads", start_text_downloads)
+
+
+def node_log_lines(out):
+    return [line for line in out.splitlines() if line.startswith(("Converted ", "Processed "))]
+
+
+def test_process_pool_logs_match_serial_build(merge, dlc_repo, monkeypatch, capsys):
+    if multiprocessing.get_start_method() != "fork":
+        pytest.skip("workers import the script by module name, which only fork provides")
+    dlc_source = {"url": DLC_URL, "format": "dlc", "name": "example"}
+    write_nodes(Path("source"), {"a": [dlc_source], "b": [dlc_source]})
+
+    logs = {}
+    for workers in (1, 2):
+        monkeypatch.setenv("RULE_PROCESS_WORKERS", str(workers))
+        generated_rules = merge.collect_generated_rules(Path("source"))[0]
+        logs[workers] = node_log_lines(capsys.readouterr().out)
+    assert generated_rules["a.yaml"] == generated_rules["b.yaml"]
+    assert logs[1] == [
+        CONVERTED_LINE,
+        "Processed source/a.yaml::a: source=4, deduped=4, duplicates=0, covered=0, ip_covered=0",
+        CONVERTED_LINE,
+        "Processed source/b.yaml::b: source=4, deduped=4, duplicates=0, covered=0, ip_covered=0",
+    ]
+    assert logs[2] == logs[1]
+
+
+@pytest.mark.parametrize("first", ["A.yaml", "B.yaml"])
+def test_every_node_log_reports_shared_dlc_conversion(merge, dlc_repo, monkeypatch, capsys, first):
+    monkeypatch.setenv("RULE_PROCESS_WORKERS", "1")
+    dlc_source = {"url": DLC_URL, "format": "dlc", "name": "example"}
+    write_nodes(
+        Path("source"), {"a": [f"{BASE_URL}/A.yaml", dlc_source], "b": [f"{BASE_URL}/B.yaml", dlc_source]}
+    )
+    order = sorted(TEXTS, key=lambda url: not url.endswith(first))
+    fake_downloads(merge, monkeypatch, order)
+    merge.collect_generated_rules(Path("source"))
+    assert node_log_lines(capsys.readouterr().out) == [
+        CONVERTED_LINE,
+        "Processed source/a.yaml::a: source=5, deduped=5, duplicates=0, covered=0, ip_covered=0",
+        CONVERTED_LINE,
+        "Processed source/b.yaml::b: source=5, deduped=5, duplicates=0, covered=0, ip_covered=0",
+    ]
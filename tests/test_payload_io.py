@@ -0,0 +1,113 @@
+import random
+
+import pytest
+import yaml
+
+import payload_io
+
+
+EDGE_CASE_ITEMS = [
+    "DOMAIN-SUFFIX,example.com",
+    "IP-CIDR,10.0.0.0/8,no-resolve",
+    "*.example.com",
+    "&anchor",
+    "!tag",
+    "%directive",
+    "@reserved",
+    "`backtick",
+    "key: value",
+    "DOMAIN,a: b",
+    "PROCESS-NAME,app #1",
+    "PROCESS-NAME,app#1",
+    "it's",
+    "'quoted'",
+    'say "hi"',
+    '"quoted"',
+    " leading",
+    "trailing ",
+    "trailing:",
+    "yes",
+    "No",
+    "TRUE",
+    "off",
+    "null",
+    "Null",
+    "~",
+    "y",
+    "123",
+    "-1",
+    "1.5",
+    "1e3",
+    "0x1F",
+    "0o17",
+    "1_000",
+    ".inf",
+    ".NaN",
+    "2024-01-01",
+    "12:30:45",
+    "PROCESS-NAME,微信",
+    "DOMAIN-SUFFIX,例子.测试",
+    "é",
+    "PROCESS-NAME,café ☕",
+    "",
+    "tab\tinside",
+    "line\nbreak",
+    "PROCESS-PATH,C:\\Program Files\\App\\app.exe",
+    "PROCESS-NAME," + "long name " * 10,
+    "DOMAIN-KEYWORD," + "x" * 120,
+]
+
+
+def yaml_dump_payload(payload):
+    return yaml.dump(
+        {"payload": payload},
+        Dumper=payload_io.SafeDumper,
+        allow_unicode=True,
+        sort_keys=False,
+        default_flow_style=False,
+    )
+
+
+def assert_renders_like_yaml(payload):
+    text = payload_io.render_payload(payload)
+    assert text == yaml_dump_payload(payload)
+    assert yaml.safe_load(text) == {"payload": payload}
+
+
+@pytest.mark.parametrize("item", EDGE_CASE_ITEMS)
+def test_render_payload_matches_yaml_dump(item):
+    assert_renders_like_yaml([item])
+
+
+def test_render_payload_matches_yaml_dump_for_whole_list():
+    assert_renders_like_yaml(EDGE_CASE_ITEMS)
+    assert_renders_like_yaml([])
+
+
+def test_render_payload_matches_yaml_dump_for_random_items():
+    rng = random.Random(20240101)
+    alphabet = "aZ09.,-_/:#'\" *&!%@?|>[]{}~\\é测"
+    for _ in range(2000):
+        item = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 90)))
+        assert_renders_like_yaml([item])
+
+
+@pytest.mark.parametrize(
+    "item, plain",
+    [
+        ("DOMAIN,example.com", True),
+        ("PROCESS-NAME,微信", True),
+        ("*.example.com", False),
+        ("key: value", False),
+        ("a #comment", False),
+        (" leading", False),
+        ("trailing ", False),
+        ("yes", False),
+        ("123", False),
+        ("", False),
+        (123, False),
+    ],
+)
+def test_is_plain_payload_item(item, plain):
+    assert payload_io.is_plain_payload_item(item) is plain
+
@@ -0,0 +1,93 @@
+from pathlib import Path
+
+import pytest
+import yaml
+
+import proxy_weighting
+
+
+DIRECT_PAYLOAD = [
+    "DOMAIN-SUFFIX,example.com",
+    "DOMAIN,example.org",
+    "IP-CIDR,10.0.0.0/8,no-resolve",
+    "IP-CIDR,192.168.0.0/25",
+    "IP-CIDR,192.168.0.128/25",
+    "PROCESS-NAME,app.exe",
+]
+PROXY_PAYLOAD = [
+    "PROCESS-NAME,app.exe",
+    "DOMAIN,Example.org.",
+    "DOMAIN,www.example.com",
+    "DOMAIN-SUFFIX,a.example.com",
+    "DOMAIN,badexample.com",
+    "DOMAIN-SUFFIX,example.com,extra",
+    "IP-CIDR,10.1.0.0/16",
+    "IP-CIDR,192.168.0.0/24",
+    "IP-CIDR,192.168.0.0/23",
+    "DOMAIN-SUFFIX,keep.net",
+]
+SUB_PROXY_PAYLOAD = ["DOMAIN,x.ads.example", "DOMAIN,ads.example.net"]
+SEMANTIC_KEPT = [
+    "DOMAIN,badexample.com",
+    "DOMAIN-SUFFIX,example.com,extra",
+    "IP-CIDR,192.168.0.0/23",
+    "DOMAIN-SUFFIX,keep.net",
+]
+
+
+def write_payload(file_path, payload):
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    file_path.write_text(yaml.safe_dump({"payload": payload}), encoding="utf-8")
+
+
+@pytest.fixture
+def rules_set_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    rules_set_dir = Path("rules/rules_set")
+    write_payload(rules_set_dir / "direct.yaml", DIRECT_PAYLOAD)
+    write_payload(rules_set_dir / "proxy.yaml", PROXY_PAYLOAD)
+    write_payload(rules_set_dir / "sub" / "reject.yaml", ["DOMAIN-SUFFIX,ads.example"])
+    write_payload(rules_set_dir / "sub" / "proxy.yaml", SUB_PROXY_PAYLOAD)
+    return rules_set_dir
+
+
+def read_payload(file_path):
+    return yaml.safe_load(file_path.read_text(encoding="utf-8"))["payload"]
+
+
+def test_exact_mode_drops_only_identical_rules(weighting, rules_set_dir, monkeypatch, capsys):
+    monkeypatch.delenv("RULE_WEIGHTING_MODE", raising=False)
+    assert weighting.main() == 0
+    assert read_payload(rules_set_dir / "proxy.yaml") == PROXY_PAYLOAD[1:]
+    assert read_payload(rules_set_dir / "sub" / "proxy.yaml") == SUB_PROXY_PAYLOAD
+    assert "removed=1 (exact=1, suffix=0, cidr=0)" in capsys.readouterr().out
+
+
+def test_semantic_mode_counts_each_shadow_kind(weighting, rules_set_dir, monkeypatch, capsys):
+    monkeypatch.setenv("RULE_WEIGHTING_MODE", "semantic")
+    assert weighting.main() == 0
+    assert read_payload(rules_set_dir / "proxy.yaml") == SEMANTIC_KEPT
+    assert read_payload(rules_set_dir / "sub" / "proxy.yaml") == ["DOMAIN,ads.example.net"]
+    out = capsys.readouterr().out
+    assert "original=10, filtered=4, removed=6 (exact=2, suffix=2, cidr=2)" in out
+    assert "original=2, filtered=1, removed=1 (exact=0, suffix=1, cidr=0)" in out
+
+
+@pytest.mark.parametrize("mode", ["exact", "semantic"])
+def test_parallel_weighting_matches_serial(rules_set_dir, mode):
+    rules_payloads = proxy_weighting.load_rules_payloads(rules_set_dir)
+    serial = proxy_weighting.build_proxy_updates(rules_payloads, mode, workers=1)
+    assert len(serial) == 2
+    assert proxy_weighting.build_proxy_updates(rules_payloads, mode, workers=2) == serial
+
+
+def test_weighting_workers_from_environment(weighting, rules_set_dir, monkeypatch, capsys):
+    monkeypatch.setenv("RULE_WEIGHTING_MODE", "semantic")
+    monkeypatch.setenv("RULE_WEIGHTING_WORKERS", "2")
+    assert proxy_weighting.get_weighting_workers() == 2
+    assert weighting.main() == 0
+    assert read_payload(rules_set_dir / "proxy.yaml") == SEMANTIC_KEPT
+
+    monkeypatch.setenv("RULE_WEIGHTING_WORKERS", "many")
+    with pytest.raises(proxy_weighting.RuleWeightingError):
+        proxy_weighting.get_weighting_workers()
@@ -0,0 +1,167 @@
+import ipaddress
+import random
+
+import pytest
+
+from rule_index import DomainSuffixTrie, IntervalIndex, collapse_intervals, find_covered_intervals
+from rule_record import parse_rule
+
+
+def test_trie_matches_suffix_and_exact_domain():
+    trie = DomainSuffixTrie(["example.com", "co.uk"])
+    assert len(trie) == 2
+    assert trie.covers("example.com")
+    assert trie.covers("a.b.example.com")
+    assert trie.covers("shop.co.uk")
+    assert "www.example.com" in trie
+    assert not trie.covers("example.org")
+    assert not trie.covers("com")
+
+
+def test_trie_without_self_matches_only_subdomains():
+    trie = DomainSuffixTrie(["example.com"])
+    assert not trie.covers("example.com", include_self=False)
+    assert trie.covers("www.example.com", include_self=False)
+
+
+def test_trie_respects_label_boundaries():
+    trie = DomainSuffixTrie(["example.com"])
+    assert not trie.covers("badexample.com")
+    assert not trie.covers("www.badexample.com")
+    assert not trie.covers("example.com.evil.net")
+
+
+def test_trie_counts_each_suffix_once():
+    trie = DomainSuffixTrie(["example.com", "example.com", "a.example.com"])
+    assert len(trie) == 2
+    assert DomainSuffixTrie().covers("example.com") is False
+
+
+def test_domain_suffix_covers_domain_rules(merge):
+    items = [
+        "DOMAIN,example.com",
+        "DOMAIN,www.example.com",
+        "DOMAIN,badexample.com",
+        "DOMAIN-SUFFIX,example.com",
+        "DOMAIN-SUFFIX,cdn.example.com",
+        "DOMAIN-SUFFIX,example.org",
+        "DOMAIN-KEYWORD,example",
+    ]
+    records, removed = merge.remove_covered_domain_rules([parse_rule(item) for item in items])
+    assert removed == 3
+    assert [record.text for record in records] == [
+        "DOMAIN,badexample.com",
+        "DOMAIN-SUFFIX,example.com",
+        "DOMAIN-SUFFIX,example.org",
+        "DOMAIN-KEYWORD,example",
+    ]
+
+
+def random_networks(rng, version, count):
+    if version == 4:
+        base, max_prefixlen, span = int(ipaddress.ip_address("10.0.0.0")), 32, 12
+    else:
+        base, max_prefixlen, span = int(ipaddress.ip_address("2001:db8::")), 128, 12
+    networks = []
+    for _ in range(count):
+        host_bits = rng.randint(0, span)
+        offset = rng.randrange(1 << span) >> host_bits << host_bits
+        networks.append(ipaddress.ip_network((base + offset, max_prefixlen - host_bits)))
+    return networks
+
+
+def to_intervals(networks):
+    return [
+        (int(network.network_address), int(network.broadcast_address), network.prefixlen)
+        for network in networks
+    ]
+
+
+FIXED_CASES = [
+    # Nested, equal and adjacent blocks.
+    ["10.0.0.0/8", "10.1.0.0/16", "10.1.2.0/24", "10.0.0.0/8", "11.0.0.0/8", "10.255.255.255/32"],
+    # Two /25 halves that merge into a /24, next to an unrelated /24.
+    ["192.168.0.0/25", "192.168.0.128/25", "192.168.1.0/24", "192.168.3.0/24"],
+    ["2001:db8::/32", "2001:db8:1::/48", "2001:db9::/32", "2001:db8::/33", "2001:db8:8000::/33"],
+    ["::ffff:10.0.0.0/104", "::ffff:10.1.0.0/112", "fe80::/10", "fe80::1/128"],
+]
+
+
+def covered_by_brute_force(networks):
+    return {
+        position
+        for position, network in enumerate(networks)
+        if any(
+            other.prefixlen < network.prefixlen and network.subnet_of(other)
+            for other in networks
+            if other.version == network.version
+        )
+    }
+
+
+def check_covered(networks):
+    assert find_covered_intervals(to_intervals(networks)) == covered_by_brute_force(networks)
+
+
+def check_collapse(networks):
+    covered = covered_by_brute_force(networks)
+    kept = list(dict.fromkeys(network for position, network in enumerate(networks) if position not in covered))
+    blocks = []
+    seen = []
+    for block_start, prefixlen, members in collapse_intervals(to_intervals(kept), kept[0].max_prefixlen):
+        block = ipaddress.ip_network((block_start, prefixlen))
+        blocks.append(block)
+        assert members
+        assert all(kept[member].subnet_of(block) for member in members)
+        seen.extend(members)
+    assert sorted(seen) == list(range(len(kept)))
+    assert blocks == list(ipaddress.collapse_addresses(kept))
+
+
+@pytest.mark.parametrize("case", FIXED_CASES)
+def test_find_covered_intervals_matches_ipaddress(case):
+    check_covered([ipaddress.ip_network(value) for value in case])
+
+
+@pytest.mark.parametrize("case", FIXED_CASES)
+def test_collapse_intervals_matches_collapse_addresses(case):
+    check_collapse([ipaddress.ip_network(value) for value in case])
+
+
+@pytest.mark.parametrize("version", [4, 6])
+def test_interval_helpers_match_ipaddress_on_random_networks(version):
+    rng = random.Random(version)
+    for _ in range(200):
+        networks = random_networks(rng, version, rng.randint(1, 30))
+        check_covered(networks)
+        check_collapse(networks)
+
+
+def test_interval_index_covers_merged_intervals():
+    index = IntervalIndex([(10, 19)])
+    index.add(20, 29)
+    index.add(40, 49)
+    assert len(index) == 2
+    assert index.covers(10, 29)
+    assert index.covers(15, 25)
+    assert index.covers(45, 45)
+    assert not index.covers(25, 35)
+    assert not index.covers(5, 12)
+    assert not index.covers(30, 39)
+    assert not IntervalIndex().covers(0, 0)
+
+
+@pytest.mark.parametrize("version", [4, 6])
+def test_interval_index_matches_brute_force_on_random_networks(version):
+    rng = random.Random(100 + version)
+    for _ in range(100):
+        networks = random_networks(rng, version, rng.randint(1, 20))
+        index = IntervalIndex()
+        addresses = set()
+        for network in networks:
+            start, end = int(network.network_address), int(network.broadcast_address)
+            index.add(start, end)
+            addresses.update(range(start, end + 1))
+        for query in random_networks(rng, version, 20):
+            start, end = int(query.network_address), int(query.broadcast_address)
+            assert index.covers(start, end) == addresses.issuperset(range(start, end + 1))
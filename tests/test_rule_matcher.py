@@ -0,0 +1,151 @@
+import ipaddress
+import random
+import re
+
+import pytest
+
+from rule_matcher import DomainMatcher, KeywordMatcher, NetworkMatcher, RuleMatcher
+
+
+LABELS = ["a", "b", "ab", "cdn", "example", "com", "net", "cn"]
+KEYWORDS = ["ab", "exam", "cdn", "b.c", "ple", "a"]
+REGEXES = [r"^a\.", r"b\.com$", r"(cdn|net)\.cn$", r"^ex.*e\."]
+
+
+def random_host(rng):
+    return ".".join(rng.choice(LABELS) for _ in range(rng.randint(1, 4)))
+
+
+def random_network(rng, version):
+    if version == 4:
+        base, max_prefixlen = int(ipaddress.ip_address("10.0.0.0")), 32
+    else:
+        base, max_prefixlen = int(ipaddress.ip_address("2001:db8::")), 128
+    host_bits = rng.randint(0, 5)
+    offset = rng.randrange(1 << 8) >> host_bits << host_bits
+    return ipaddress.ip_network((base + offset, max_prefixlen - host_bits))
+
+
+def random_classical_rule(rng):
+    kind = rng.choice(["DOMAIN", "DOMAIN-SUFFIX", "DOMAIN-KEYWORD", "DOMAIN-REGEX", "IP-CIDR", "IP-CIDR6"])
+    if kind == "DOMAIN-KEYWORD":
+        return f"{kind},{rng.choice(KEYWORDS)}"
+    if kind == "DOMAIN-REGEX":
+        return f"{kind},{rng.choice(REGEXES)}"
+    if kind == "IP-CIDR":
+        return f"{kind},{random_network(rng, 4)},no-resolve"
+    if kind == "IP-CIDR6":
+        return f"{kind},{random_network(rng, 6)}"
+    return f"{kind},{random_host(rng)}"
+
+
+def random_domain_item(rng):
+    return rng.choice(["", "+.", "."]) + random_host(rng)
+
+
+def naive_item_matches(behavior, item, query):
+    """Decide one rule by hand, the way a client walking the rule list would."""
+    try:
+        address = ipaddress.ip_address(query)
+    except ValueError:
+        address = None
+    if behavior == "ipcidr":
+        return address is not None and address in ipaddress.ip_network(item)
+    if behavior == "domain":
+        if address is not None:
+            return False
+        if item.startswith("+."):
+            return query == item[2:] or query.endswith(item[1:])
+        if item.startswith("."):
+            return query.endswith(item)
+        return query == item
+
+    rule_type, value = item.split(",")[:2]
+    if rule_type in ("IP-CIDR", "IP-CIDR6"):
+        return address is not None and address in ipaddress.ip_network(value)
+    if address is not None:
+        return False
+    if rule_type == "DOMAIN":
+        return query == value
+    if rule_type == "DOMAIN-SUFFIX":
+        return query == value or query.endswith("." + value)
+    if rule_type == "DOMAIN-KEYWORD":
+        return value in query
+    if rule_type == "DOMAIN-REGEX":
+        return re.search(value, query) is not None
+    return False
+
+
+def naive_match(rule_sets, query):
+    for name, behavior, payload in rule_sets:
+        for item in payload:
+            if naive_item_matches(behavior, item, query):
+                return name, item
+    return None
+
+
+def build_rule_sets(rng):
+    rule_sets = []
+    for index in range(6):
+        behavior = ["classical", "domain", "ipcidr"][index % 3]
+        if behavior == "classical":
+            payload = [random_classical_rule(rng) for _ in range(30)]
+        elif behavior == "domain":
+            payload = [random_domain_item(rng) for _ in range(30)]
+        else:
+            payload = [str(random_network(rng, rng.choice([4, 6]))) for _ in range(15)]
+        rule_sets.append((f"set{index}", behavior, payload))
+    return rule_sets
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_rule_matcher_matches_linear_scan(seed):
+    rng = random.Random(seed)
+    rule_sets = build_rule_sets(rng)
+    matcher = RuleMatcher()
+    for name, behavior, payload in rule_sets:
+        matcher.add_rule_set(name, behavior, payload)
+    assert not matcher.unsupported
+
+    queries = [random_host(rng) for _ in range(300)]
+    queries += [
+        str(random_network(rng, version).network_address + rng.randrange(4)) for version in (4, 6) * 50
+    ]
+    for query in queries:
+        assert matcher.match(query) == naive_match(rule_sets, query), query
+
+
+def test_domain_matcher_prefers_first_rule_position():
+    matcher = DomainMatcher()
+    matcher.add("example.com", 5, "suffix")
+    matcher.add("www.example.com", 3, "exact")
+    matcher.add("example.com", 1, "subdomain")
+    assert matcher.match("www.example.com") == 1
+    assert matcher.match("example.com") == 5
+    assert matcher.match("badexample.com") is None
+
+
+def test_keyword_matcher_matches_linear_scan():
+    rng = random.Random(7)
+    keywords = ["".join(rng.choice("abc") for _ in range(rng.randint(1, 4))) for _ in range(40)]
+    matcher = KeywordMatcher()
+    for position, keyword in enumerate(keywords):
+        matcher.add(keyword, position)
+    for _ in range(500):
+        text = "".join(rng.choice("abcd") for _ in range(rng.randint(0, 12)))
+        expected = next((position for position, keyword in enumerate(keywords) if keyword in text), None)
+        assert matcher.match(text) == expected, text
+
+
+def test_network_matcher_matches_linear_scan():
+    rng = random.Random(11)
+    networks = [random_network(rng, rng.choice([4, 6])) for _ in range(60)]
+    matcher = NetworkMatcher()
+    for position, network in enumerate(networks):
+        matcher.add(network, position)
+    for _ in range(500):
+        address = random_network(rng, rng.choice([4, 6])).network_address + rng.randrange(8)
+        expected = next(
+            (position for position, network in enumerate(networks) if address in network), None
+        )
+        assert matcher.match(address) == expected, address
@@ -0,0 +1,101 @@
+import pytest
+
+from rule_record import RuleRecord, parse_rule, split_behavior_payloads
+
+
+@pytest.mark.parametrize(
+    "item, rule_type, value, options, text",
+    [
+        ("DOMAIN,WWW.Example.COM.", "DOMAIN", "www.example.com", (), "DOMAIN,www.example.com"),
+        (
+            "domain-suffix, Example.com ,extra",
+            "DOMAIN-SUFFIX",
+            "example.com",
+            ("extra",),
+            "DOMAIN-SUFFIX,example.com,extra",
+        ),
+        ("DOMAIN-KEYWORD,Foo.", "DOMAIN-KEYWORD", "foo.", (), "DOMAIN-KEYWORD,foo."),
+        (
+            "IP-CIDR,10.1.2.3/8,No-Resolve",
+            "IP-CIDR",
+            "10.0.0.0/8",
+            ("no-resolve",),
+            "IP-CIDR,10.0.0.0/8,no-resolve",
+        ),
+        (
+            "IP-CIDR6,2001:DB8::1/32, no-resolve",
+            "IP-CIDR6",
+            "2001:db8::/32",
+            ("no-resolve",),
+            "IP-CIDR6,2001:db8::/32,no-resolve",
+        ),
+        (
+            "IP-CIDR6,::FFFF:10.0.0.0/104",
+            "IP-CIDR6",
+            "::ffff:10.0.0.0/104",
+            (),
+            "IP-CIDR6,::ffff:10.0.0.0/104",
+        ),
+    ],
+)
+def test_parse_rule_normalizes_domain_and_ip_rules(item, rule_type, value, options, text):
+    record = parse_rule(item)
+    assert (record.rule_type, record.value, record.options, record.text) == (rule_type, value, options, text)
+    assert record.original == item
+    assert (record.network is not None) == rule_type.startswith("IP-")
+
+
+@pytest.mark.parametrize("item", ["IP-CIDR,not-an-ip", "GEOIP,CN", "PROCESS-NAME,App.exe", "MATCH", "DOMAIN,"])
+def test_parse_rule_keeps_other_rules_verbatim(item):
+    record = parse_rule(item)
+    assert record.text == item
+    assert record.network is None
+
+
+def test_parse_rule_keeps_non_string_items():
+    record = parse_rule(42)
+    assert record.rule_type is None
+    assert record.text == 42
+
+
+def test_records_dedupe_on_normalized_text():
+    records = [
+        parse_rule("DOMAIN,Example.com"),
+        parse_rule("DOMAIN, example.com."),
+        parse_rule("IP-CIDR,10.0.0.1/8,NO-RESOLVE"),
+        parse_rule("IP-CIDR,10.0.0.0/8,no-resolve"),
+        parse_rule("IP-CIDR,10.0.0.0/8"),
+    ]
+    assert records[0] == records[1]
+    assert records[2] == records[3]
+    assert records[3] != records[4]
+    assert len(set(records)) == 3
+    assert records[0] != "DOMAIN,example.com"
+    assert isinstance(records[0], RuleRecord)
+
+
+def test_parse_rule_records_keeps_first_original(merge):
+    items = ["DOMAIN,Example.com", "DOMAIN,example.com", "DOMAIN-SUFFIX,example.com"]
+    records = merge.parse_rule_records(items)
+    assert [record.original for record in records] == ["DOMAIN,Example.com", "DOMAIN-SUFFIX,example.com"]
+
+
+def test_split_behavior_payloads_routes_rules_by_provider_behavior():
+    payload = [
+        "DOMAIN,www.example.com",
+        "DOMAIN-SUFFIX,example.com",
+        "DOMAIN-KEYWORD,tracker",
+        "IP-CIDR,10.0.0.0/8,no-resolve",
+        "IP-CIDR6,2001:db8::/32",
+        "IP-CIDR,not-an-ip",
+        "PROCESS-NAME,app.exe",
+    ]
+    assert split_behavior_payloads(payload) == {
+        "domain": ["www.example.com", "+.example.com"],
+        "ipcidr": ["10.0.0.0/8", "2001:db8::/32"],
+        "classical": ["DOMAIN-KEYWORD,tracker", "IP-CIDR,not-an-ip", "PROCESS-NAME,app.exe"],
+    }
+
+
+def test_split_behavior_payloads_of_empty_payload():
+    assert split_behavior_payloads([]) == {"domain": [], "ipcidr": [], "classical": []}